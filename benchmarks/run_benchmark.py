@@ -0,0 +1,185 @@
+"""
+Offline load benchmark for the RAG service.
+
+Starts the FastAPI app in-process (ASGI transport, no sockets) against the local stand-ins from
+benchmarks/stubs.py, then drives /ingest, /retrieve and /generate-questions at a fixed concurrency
+and reports throughput, p50/p95/p99 latency and peak RSS.
+
+Usage (from the repo root):
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python -m benchmarks.run_benchmark --concurrency 16 --requests 200 --llm-latency 0.4
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import resource
+
+# The app reads these at import time, so set them before importing it
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("TRACING_ENABLED", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+import httpx
+from loguru import logger
+
+from benchmarks.stubs import LatencyModel, install_stubs
+
+WORDS = (
+    "cache latency index vector embedding partition replica consensus quorum shard "
+    "throughput queue stream batch commit rollback snapshot transaction isolation lock"
+).split()
+
+
+def synthetic_text(rng: random.Random, n_chars: int) -> str:
+    words = []
+    length = 0
+    while length < n_chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_phase(name: str, make_request, total: int, concurrency: int):
+    """Fires `total` requests with at most `concurrency` in flight; returns a result dict"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                failures += 1
+                if failures <= 3:
+                    logger.warning(f"{name} request failed: {response.status_code} {response.text[:200]}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "phase": name,
+        "requests": total,
+        "failures": failures,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    detector = install_stubs(
+        llm_latency=LatencyModel(args.llm_latency, args.jitter, seed=args.seed),
+        embed_latency=LatencyModel(args.embed_latency, args.jitter, seed=args.seed + 1),
+        detector_latency=LatencyModel(args.detector_latency, args.jitter, seed=args.seed + 2),
+    )
+
+    from rag_server import app
+
+    token = jwt.encode({"sub": "benchmark", "exp": int(time.time()) + 3600}, os.environ["SECRET_KEY"], algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    tenant_id = str(uuid.uuid4())
+    test_ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(args.tests)]
+
+    # Run the app's lifespan so startup (key loading, init hooks, sweeper) and shutdown are measured too
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", headers=headers, timeout=None) as client:
+
+            async def ingest(i: int):
+                documents = [{"text": synthetic_text(rng, args.doc_chars)} for _ in range(args.docs_per_request)]
+                return await client.post("/ingest", data={
+                    "test_id": test_ids[i % len(test_ids)],
+                    "tenant_id": tenant_id,
+                    "documents_json": json.dumps(documents),
+                })
+
+            async def retrieve(i: int):
+                # A fraction of answers repeat so the caches see realistic hits
+                answer_seed = i % max(1, int(args.requests * (1 - args.repeat_ratio)))
+                return await client.post("/retrieve", json={
+                    "question": f"Explain topic {answer_seed % 20}",
+                    "query": synthetic_text(random.Random(answer_seed), 400),
+                    "filters": {"test_id": test_ids[i % len(test_ids)]},
+                    "top_k": args.top_k,
+                })
+
+            async def generate(i: int):
+                return await client.post("/generate-questions", json={
+                    "test_id": test_ids[i % len(test_ids)],
+                    "num_questions": 5,
+                    "already_has": [],
+                })
+
+            results = [await run_phase("ingest", ingest, args.ingest_requests, args.concurrency)]
+            if "retrieve" in args.phases:
+                results.append(await run_phase("retrieve", retrieve, args.requests, args.concurrency))
+            if "generate-questions" in args.phases:
+                results.append(await run_phase("generate-questions", generate, args.requests, args.concurrency))
+
+    detector.stop()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the RAG service")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per query phase")
+    parser.add_argument("--ingest-requests", type=int, default=20)
+    parser.add_argument("--tests", type=int, default=4, help="distinct test_ids to spread data over")
+    parser.add_argument("--docs-per-request", type=int, default=2)
+    parser.add_argument("--doc-chars", type=int, default=20000)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="fraction of repeated /retrieve answers")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per Gemini call")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds per embedding call")
+    parser.add_argument("--detector-latency", type=float, default=0.1, help="seconds per ZeroGPT call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="mean of exponential jitter added to every latency")
+    parser.add_argument("--phases", nargs="+", default=["retrieve", "generate-questions"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Per-request INFO logs would dominate the measurement
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = asyncio.run(main(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        columns = ["phase", "requests", "failures", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"]
+        print(" ".join(f"{c:>18}" for c in columns))
+        for row in results:
+            print(" ".join(f"{str(row[c]):>18}" for c in columns))
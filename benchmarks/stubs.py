@@ -0,0 +1,207 @@
+"""
+Local stand-ins for every external dependency of the RAG service, so the app can be
+benchmarked on a laptop with no network:
+
+- FakeGenAI:        replaces the google.generativeai module (GenerativeModel, configure, GenerationConfig)
+- HashEmbedder:     deterministic hash-based embeddings with the same encode() contract as GoogleEmbeddingAdapter
+- local Chroma:     chromadb.EphemeralClient (in-memory)
+- fakeredis:        replaces utils.redis_init.redis_client
+- StubDetector:     tiny HTTP server speaking the ZeroGPT response format
+
+Each stand-in takes an injected latency (seconds) so provider slowness can be simulated.
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 768
+
+
+class LatencyModel:
+    """Fixed base latency plus optional exponential jitter (so p99 differs from p50)"""
+
+    def __init__(self, base: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.base = base
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.jitter <= 0:
+            return self.base
+        with self._lock:
+            return self.base + self._rng.expovariate(1 / self.jitter)
+
+    def sleep(self):
+        delay = self.sample()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# --- Gemini ---
+
+GRADING_ANSWER = {
+    "overall_score": 72,
+    "breakdown": [
+        {"criterion": "accuracy", "score": 30, "max": 40},
+        {"criterion": "completeness", "score": 18, "max": 25},
+        {"criterion": "relevance", "score": 11, "max": 15},
+        {"criterion": "reasoning", "score": 7, "max": 10},
+        {"criterion": "clarity", "score": 4, "max": 5},
+        {"criterion": "citations", "score": 2, "max": 5},
+    ],
+    "confidence": 0.8,
+    "pass": True,
+    "rationale": "Mostly correct and supported by the retrieved context.",
+    "improvements": ["Cite the source ids", "Explain the trade-offs"],
+    "evidence": {"supporting_doc_ids": [], "contradicting_doc_ids": [], "unsupported_claims": []},
+}
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt: str):
+        self.text = text
+        self.parts = [SimpleNamespace(text=text)] if text else []
+        # Rough 4-chars-per-token estimate, good enough for the token counters
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=len(prompt) // 4,
+            candidates_token_count=len(text) // 4,
+        )
+
+
+class FakeGenerativeModel:
+    """Mimics genai.GenerativeModel.generate_content; picks a canned answer from the prompt shape"""
+
+    def __init__(self, latency: LatencyModel, model_name: str = "gemini-2.5-flash", system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+        self.latency = latency
+
+    def generate_content(self, contents, **kwargs):
+        prompt = contents if isinstance(contents, str) else json.dumps(contents, default=str)
+        self.latency.sleep()
+
+        if "evaluator" in self.system_instruction:
+            text = json.dumps(GRADING_ANSWER)
+        elif "interview questions" in prompt:
+            text = json.dumps([
+                {"question_no": i + 1, "content": f"Synthetic question {i + 1}?"} for i in range(5)
+            ])
+        else:
+            text = "A generalized reference answer covering the key concepts of the question."
+        return FakeResponse(text, prompt)
+
+
+class FakeGenAI:
+    """Drop-in for the google.generativeai module as used through utils.rag_initialization.genai"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.GenerationConfig = dict
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name: str = "gemini-2.5-flash", **kwargs):
+        return FakeGenerativeModel(self.latency, model_name=model_name, **kwargs)
+
+
+# --- Embeddings ---
+
+class HashEmbedder:
+    """Deterministic embeddings: each text seeds a PRNG from its blake2b digest"""
+
+    def __init__(self, latency: LatencyModel, dim: int = EMBEDDING_DIM):
+        self.latency = latency
+        self.dim = dim
+
+    def _vector(self, text: str):
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, documents, **kwargs):
+        self.latency.sleep()
+        if isinstance(documents, str):
+            return self._vector(documents)
+        return np.stack([self._vector(d) for d in documents]) if documents else np.empty((0, self.dim), np.float32)
+
+
+# --- ZeroGPT ---
+
+class StubDetector:
+    """Threaded HTTP server returning {"data": {"fakePercentage": ...}} like ZeroGPT"""
+
+    def __init__(self, latency: LatencyModel):
+        latency_model = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                latency_model.sleep()
+                text = json.loads(body or b"{}").get("input_text", "")
+                score = int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16) % 10000 / 100
+                payload = json.dumps({"success": True, "data": {"fakePercentage": score}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/detect"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def install_stubs(llm_latency: LatencyModel, embed_latency: LatencyModel, detector_latency: LatencyModel):
+    """
+    Swaps the app's startup hooks (rag_initialization / redis_init) for ones that point the
+    module-level state at the local stand-ins, so the real lifespan runs unchanged around them.
+    Must run BEFORE rag_server is imported (it binds both hooks at import time).
+    Returns the started StubDetector so the caller can stop it.
+    """
+    import os
+    import chromadb
+    import fakeredis
+    import utils.rag_initialization as rag_state
+    import utils.redis_init as redis_state
+
+    detector = StubDetector(detector_latency).start()
+    os.environ["ZERO_GPT_URL"] = detector.url
+    os.environ["ZERO_GPT_API_KEY"] = "benchmark"
+
+    def stub_rag_initialization():
+        rag_state.GEMINI_API_KEY = "benchmark"
+        rag_state.genai = FakeGenAI(llm_latency)
+        rag_state.embedding_model = HashEmbedder(embed_latency)
+        rag_state.chroma_client = chromadb.EphemeralClient()
+        rag_state.collection = rag_state.chroma_client.get_or_create_collection(name=rag_state.SHARED_COLLECTION_NAME)
+
+    def stub_redis_init():
+        redis_state.redis_client = fakeredis.FakeRedis(decode_responses=True)
+
+    rag_state.rag_initialization = stub_rag_initialization
+    redis_state.redis_init = stub_redis_init
+    return detector
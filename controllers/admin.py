@@ -0,0 +1,40 @@
+from pydantic import UUID4
+from fastapi import HTTPException
+from models.ReindexRequest import ReindexRequest
+from models.AdminJobResponse import AdminJobResponse
+from utils.test_lifecycle import submit_delete_job, submit_reindex_job, get_job, JobConflictError
+from loguru import logger
+
+
+async def delete_test_data(test_id: UUID4):
+    """
+    Deletes every chunk of a test (all index versions and the local snapshot) in the background.
+    """
+    try:
+        job = submit_delete_job(str(test_id))
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    logger.info(f"Queued delete job {job['job_id']} for Test ID: {test_id}")
+    return AdminJobResponse(**job)
+
+
+async def reindex_test_data(test_id: UUID4, payload: ReindexRequest):
+    """
+    Re-chunks and re-embeds a test from its stored source text in the background.
+    The new index version is swapped in atomically once it is complete.
+    """
+    try:
+        job = submit_reindex_job(str(test_id), payload.chunk_size, payload.chunk_overlap, payload.embedding_model)
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    logger.info(f"Queued re-index job {job['job_id']} for Test ID: {test_id}")
+    return AdminJobResponse(**job)
+
+
+async def admin_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return AdminJobResponse(**job)
@@ -1,15 +1,19 @@
 import json
+import asyncio
 from pydantic import UUID4
 from models.DocumentSource import DocumentSource
 from models.IngestRequest import IngestRequest
 from models.IngestResponse import IngestResponse
-from fastapi import File, UploadFile, Form
+from fastapi import File, UploadFile, Form, HTTPException
 from typing import List
 from utils.download_file_from_url import download_file_from_url
 from utils.process_text_pipeline import process_text_pipeline
 from utils.extract_text_from_bytes import extract_text_from_bytes
+from utils.vector_store import get_write_collection, TenantMismatchError
+from utils.metrics import instrumented
 from loguru import logger
 
+@instrumented("ingestion")
 async def ingestion(payload: IngestRequest):
     
     """
@@ -27,6 +31,14 @@ async def ingestion(payload: IngestRequest):
     
     processed_count = 0
     errors = []
+
+    # Tenancy: a test's partition belongs to the tenant that created it.
+    # Off the event loop: the first write to a test still in the shared collection migrates all of its chunks.
+    # The resolved partition is handed to the pipeline, so it isn't resolved again per source.
+    try:
+        collection = await asyncio.to_thread(get_write_collection, str(test_id), str(tenant_id))
+    except TenantMismatchError as e:
+        raise HTTPException(status_code=403, detail=str(e))
     
     # Parse global metadata
     try:
@@ -53,8 +65,8 @@ async def ingestion(payload: IngestRequest):
                     file_ext = doc.url.split('.')[-1].lower() if not doc.file_type else doc.file_type
                     extracted_text = extract_text_from_bytes(file_content, file_ext)
 
-                # Send to pipeline
-                process_text_pipeline(extracted_text, global_metadata)
+                # Send to pipeline (embedding + Chroma writes are blocking calls)
+                await asyncio.to_thread(process_text_pipeline, extracted_text, global_metadata, collection=collection)
                 processed_count += 1
                 
             except Exception as e:
@@ -86,7 +98,7 @@ async def ingestion(payload: IngestRequest):
                 extracted_text = extract_text_from_bytes(content, file_ext)
                 
                 # Pipeline
-                process_text_pipeline(extracted_text, global_metadata)
+                await asyncio.to_thread(process_text_pipeline, extracted_text, global_metadata, collection=collection)
                 processed_count += 1
                 
             except Exception as e:
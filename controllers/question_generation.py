@@ -1,11 +1,35 @@
-import json
+import os
 import asyncio
+from typing import List
 from models.QuestionGenerationRequest import QuestionGenerationRequest
 from models.QuestionGenerationResponse import QuestionItem,QuestionGenerationResponse
 from fastapi import HTTPException
 import utils.rag_initialization as rag_state
+from utils.llm_client import generate_content, LLMUnavailableError
+from utils.vector_store import iter_test_documents, build_bounded_context
+from utils.structured_output import json_generation_config, parse_structured, StructuredOutputError
+from utils.metrics import instrumented, track_stage, record_llm_usage
 from loguru import logger
 
+# Prompt budget for the test content. Pages stop being fetched once it is reached,
+# so memory per call stays bounded regardless of how much was ingested for the test.
+QUESTION_CONTEXT_MAX_BYTES = int(os.getenv("QUESTION_CONTEXT_MAX_BYTES", "800000"))
+QUESTION_CONTEXT_MAX_TOKENS = int(os.getenv("QUESTION_CONTEXT_MAX_TOKENS", "200000"))
+
+# Response schema for Gemini's constrained JSON decoding (a list of QuestionItem)
+QUESTIONS_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "question_no": {"type": "integer"},
+            "content": {"type": "string"},
+        },
+        "required": ["question_no", "content"],
+    },
+}
+
+@instrumented("question_generation")
 async def question_generation(payload: QuestionGenerationRequest):
     """
     Generates interview questions based on ALL content ingested for a specific test_id.
@@ -15,21 +39,20 @@ async def question_generation(payload: QuestionGenerationRequest):
     if not rag_state.GEMINI_API_KEY:
         raise HTTPException(status_code=500, detail="Gemini API Key not configured")
 
-    # 1. Fetch ALL content for this test_id
-    # collection.get() allows filtering by metadata without a query vector
-    logger.info(f"Fetching all context for Test ID: {payload.test_id}")
-    db_response = rag_state.collection.get(
-        where={"test_id": payload.test_id}
-    )
-    
-    documents = db_response.get("documents", [])
-    
-    if not documents:
-        raise HTTPException(status_code=404, detail=f"No content found for test_id: {payload.test_id}")
+    # 1 + 2. Stream content for this test_id and concatenate it up to the prompt budget
+    # collection.get() is paged and fetches documents only (no embeddings / metadata).
+    # It is blocking network I/O, so it runs off the event loop.
+    logger.info(f"Fetching context for Test ID: {payload.test_id}")
+    with track_stage("question_context_fetch"):
+        full_context = await asyncio.to_thread(
+            build_bounded_context,
+            iter_test_documents(payload.test_id),
+            QUESTION_CONTEXT_MAX_BYTES,
+            QUESTION_CONTEXT_MAX_TOKENS,
+        )
 
-    # 2. Prepare Context (Concatenate all chunks)
-    # Gemini 1.5 Flash has a large context window, so we can dump a lot of text here.
-    full_context = "\n\n".join(documents)
+    if not full_context:
+        raise HTTPException(status_code=404, detail=f"No content found for test_id: {payload.test_id}")
     
     # 3. Prompt Engineering
     prompt = f"""
@@ -46,32 +69,26 @@ async def question_generation(payload: QuestionGenerationRequest):
     """
 
     try:
-        model = rag_state.genai.GenerativeModel("gemini-2.5-flash")
-        response = await asyncio.to_thread(model.generate_content,prompt)
+        with track_stage("question_llm"):
+            response = await generate_content(prompt, generation_config=json_generation_config(QUESTIONS_RESPONSE_SCHEMA))
+        record_llm_usage("/generate-questions", "question_generation", response)
 
-        
-        if response.parts:
-            # 4. Parse Response
-            # Clean up any potential markdown formatting the LLM might still add
-            clean_text = response.text.strip()
-            if clean_text.startswith("```json"):
-                clean_text = clean_text.replace("```json", "").replace("```", "")
-            
-            questions_data = json.loads(clean_text)
-            
-            if not isinstance(questions_data, list):
-                raise ValueError("LLM did not return a list")
-
-            # Validate and convert to model list
-            formatted_questions = [QuestionItem(**q) for q in questions_data]
-            return QuestionGenerationResponse(questions=formatted_questions)
-        else:
+        if not response.parts:
             logger.warning("Gemini output was empty in question generation")
-            raise ValueError("LLM did not return a proper ouput")
+            raise HTTPException(status_code=502, detail="LLM did not return a proper output")
+
+        # 4. Parse Response
+        # Validated straight into QuestionItem models; malformed JSON gets one bounded repair
+        formatted_questions = parse_structured(response.text, List[QuestionItem], "questions")
+        return QuestionGenerationResponse(questions=formatted_questions)
 
-    except (json.JSONDecodeError, ValueError, TypeError) as e:
-        # Fallback if LLM returns bad JSON or wrong structure
-        logger.error(f"Parsing failed ({e}), falling back to line splitting.")
+    except LLMUnavailableError as e:
+        logger.error(f"Question generation skipped, LLM unavailable: {e}")
+        raise HTTPException(status_code=503, detail="AI generation temporarily unavailable, retry later")
+
+    except StructuredOutputError as e:
+        # Last resort, still cheaper than making the client regenerate: keep the lines that look like questions
+        logger.error(f"{e}, falling back to line splitting.")
         lines = [line.strip() for line in response.text.split('\n') if line.strip() and '?' in line]
         
         # Manually construct the objects
@@ -80,7 +97,10 @@ async def question_generation(payload: QuestionGenerationRequest):
             for i, line in enumerate(lines[:payload.num_questions])
         ]
         return QuestionGenerationResponse(questions=fallback_questions)
+
+    except HTTPException:
+        raise
         
     except Exception as e:
         logger.error(f"Error generating questions: {e}")
-        raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
@@ -1,3 +1,4 @@
+import os
 import uuid
 import json
 import asyncio
@@ -5,45 +6,138 @@ import utils.rag_initialization as rag_state
 from models.RetrieveRequest import RetrieveRequest
 from models.SearchResult import SearchResult
 from models.RetrieveResponse import RetrieveResponse
+from models.RetrieveBatchRequest import RetrieveBatchRequest
+from models.RetrieveBatchResponse import RetrieveBatchResponse
 from fastapi import FastAPI, HTTPException
-from utils.parse_markdown_json import parse_markdown_json
+from models.GradingAnswer import GradingAnswer
+from utils.structured_output import json_generation_config, parse_structured, StructuredOutputError
 from utils.queryexpansion import query_expansion
-from utils.test_ai_content import zero_gpt_test
+from utils.ai_detection import content_hash, get_ai_score, get_ai_scores, schedule_ai_score
+from utils.index_snapshot import open_snapshot, build_snapshot_in_background
+from utils.vector_store import resolve_collection, index_settings, TenantMismatchError
+from utils.llm_client import generate_content, LLMUnavailableError
+from utils.metrics import instrumented, track_stage, record_llm_usage, EMBEDDING_BATCH_SIZE
 from loguru import logger
 
+# Max answers of one /retrieve/batch call graded at the same time
+RETRIEVE_BATCH_CONCURRENCY = int(os.getenv("RETRIEVE_BATCH_CONCURRENCY", "8"))
 
-async def retrieval(payload: RetrieveRequest):
+GRADING_INSTRUCTION = (
+    "You are an objective, impartial technical interviewer and answer evaluator. "
+    "Use ONLY the candidate_answer and the retrieved_docs provided (treat retrieved_docs as ground-truth context). "
+    "Prioritize evidence in retrieved_docs: reward supported claims, penalize contradicted or unsupported claims. "
+    "Return ONLY the exact JSON matching the schema described below, nothing else."
+)
+
+# Response schema for Gemini's constrained JSON decoding (mirrors models/GradingAnswer.py)
+GRADING_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_score": {"type": "integer"},
+        "breakdown": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "criterion": {"type": "string", "enum": ["accuracy", "completeness", "relevance", "reasoning", "clarity", "citations"]},
+                    "score": {"type": "integer"},
+                    "max": {"type": "integer"},
+                },
+                "required": ["criterion", "score", "max"],
+            },
+        },
+        "confidence": {"type": "number"},
+        "pass": {"type": "boolean"},
+        "rationale": {"type": "string"},
+        "improvements": {"type": "array", "items": {"type": "string"}},
+        "evidence": {
+            "type": "object",
+            "properties": {
+                "supporting_doc_ids": {"type": "array", "items": {"type": "string"}},
+                "contradicting_doc_ids": {"type": "array", "items": {"type": "string"}},
+                "unsupported_claims": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "claim": {"type": "string"},
+                            "suggested_penalty_points": {"type": "integer"},
+                        },
+                        "required": ["claim", "suggested_penalty_points"],
+                    },
+                },
+            },
+            "required": ["supporting_doc_ids", "contradicting_doc_ids", "unsupported_claims"],
+        },
+    },
+    "required": ["overall_score", "breakdown", "confidence", "pass", "rationale", "improvements", "evidence"],
+}
+
+
+def _authorize(filters: dict):
+    """
+    Validates the filters and resolves the collection to search (400 without test_id, 403 on a tenant mismatch).
+    Each test lives in its own partition, so the search only scans this test's chunks (Tenancy Isolation).
+    Tests not migrated yet are read from the shared collection with a 'where' clause on test_id.
+    """
+    if not filters.get("test_id"):
+        raise HTTPException(status_code=400, detail="Missing test_id in filters")
+    try:
+        return resolve_collection(filters["test_id"], filters.get("tenant_id"))
+    except TenantMismatchError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+
+@instrumented("retrieval")
+async def retrieval(payload: RetrieveRequest, ai_score_task=None):
     """
     Retrieve relevant context for a user query using Vector Similarity, 
     then generate an answer using Gemini 2.5 Flash.
+    ai_score_task lets batch_retrieval hand in a score computed for the whole batch.
     """
 
+    target_test_id = payload.filters.get("test_id")
+    target_tenant_id = payload.filters.get("tenant_id")
+    collection, where = _authorize(payload.filters)
+
+    # --- AI-content detection runs concurrently with everything below (or fully in the background) ---
+    # Only started once the request is known to be valid and allowed to read this test
+    ai_score_id = content_hash(payload.query)
+    if payload.defer_ai_score:
+        schedule_ai_score(payload.query)
+        ai_score_task = None
+    elif ai_score_task is None:
+        ai_score_task = asyncio.create_task(get_ai_score(payload.query))
+
     # ---0. Generate generalized response ---
     # --- also generate joint_query with generalized response and user query
     generalized_response = await query_expansion(payload.question)
     joint_query = payload.query + " " + generalized_response
 
-    #check zero gpt AI plagarism score
-    ai_score = zero_gpt_test(payload.query)
-
-
-
     # --- 1. Generate Embedding for Query ---
     # We must use the SAME model for query embedding as we did for document embedding
-    query_vector = rag_state.embedding_model.encode(joint_query).tolist()
-    
-    target_test_id = payload.filters.get("test_id")
-    if not target_test_id:
-        raise HTTPException(status_code=400, detail="Missing test_id in filters")
+    # (a re-indexed test may use another model than the default one)
+    embedding_model = rag_state.get_embedding_model(index_settings(collection)["embedding_model"])
+    EMBEDDING_BATCH_SIZE.labels(stage="retrieval").observe(1)
+    with track_stage("retrieval_embedding"):
+        query_vector = embedding_model.encode(joint_query) # 1D float32 array
 
-    # --- 2. Query ChromaDB ---
-    # We use the 'where' clause to strictly filter chunks by test_id (Tenancy Isolation)
-    logger.info(f"Querying Chroma for Test ID: {target_test_id}")
-    search_results = rag_state.collection.query(
-        query_embeddings=[query_vector],
-        n_results=payload.top_k,
-        where={"test_id": target_test_id} 
-    )
+    # --- 2. Query the local snapshot, or ChromaDB ---
+    # A memory-mapped snapshot only ever contains this test's chunks; on a miss it is built in the background.
+    # Snapshots hold every row of the test, so they can't apply a shared-collection tenant filter
+    snapshot = open_snapshot(target_test_id, collection.name) if where is None or not target_tenant_id else None
+    if snapshot is not None:
+        with track_stage("snapshot_search"):
+            search_results = snapshot.query(query_vector, payload.top_k)
+    else:
+        logger.info(f"Querying Chroma for Test ID: {target_test_id}")
+        with track_stage("vector_search"):
+            search_results = collection.query(
+                query_embeddings=[query_vector],
+                n_results=payload.top_k,
+                where=where
+            )
+        build_snapshot_in_background(target_test_id)
 
      # --- 3. Format Retrieval Results (with IDs for prompt) ---
     # Chroma returns lists of lists (because it supports batch queries). We take index 0.
@@ -94,19 +188,9 @@ async def retrieval(payload: RetrieveRequest):
 
     # --- 4. Call LLM (Gemini 1.5 Flash) ---
     answer = "LLM generation failed or key not configured."
+    grading_degraded = False
     if rag_state.GEMINI_API_KEY:
         try:
-            # Initialize Model
-            model = rag_state.genai.GenerativeModel(
-                model_name="gemini-2.5-flash",
-                system_instruction=(
-                    "You are an objective, impartial technical interviewer and answer evaluator. "
-                    "Use ONLY the candidate_answer and the retrieved_docs provided (treat retrieved_docs as ground-truth context). "
-                    "Prioritize evidence in retrieved_docs: reward supported claims, penalize contradicted or unsupported claims. "
-                    "Return ONLY the exact JSON matching the schema described below, nothing else."
-                )
-            )
-
             # Prepare retrieved_docs as a compact JSON string to inject into the prompt
             # We use json.dumps to ensure valid JSON formatting inside the prompt.
             retrieved_docs_json = json.dumps(retrieved_docs_payload, ensure_ascii=False)
@@ -171,18 +255,68 @@ async def retrieval(payload: RetrieveRequest):
                                 Do the work and return ONLY the JSON described above.
                                 """
             # Generate
-            response = await asyncio.to_thread(model.generate_content,full_prompt)
+            with track_stage("llm_grading"):
+                response = await generate_content(
+                    full_prompt,
+                    system_instruction=GRADING_INSTRUCTION,
+                    generation_config=json_generation_config(GRADING_RESPONSE_SCHEMA),
+                )
+            record_llm_usage("/retrieve", "llm_grading", response)
 
             if response.parts:
-                answer = parse_markdown_json(response.text)
-
-                if answer is None:
-                    answer = {}
+                # Validated straight into GradingAnswer; malformed JSON gets one bounded repair, never a second LLM call
+                try:
+                    answer = parse_structured(response.text, GradingAnswer, "grading")
+                except StructuredOutputError as e:
+                    logger.error(f"{e}. Raw text: {response.text}")
+                    answer = {"error": "Failed to parse JSON", "raw_content": response.text}
             else:
                 logger.warning("Gemini response for analyzing answers was blocked or empty")
                 answer = {}
 
+        except LLMUnavailableError as e:
+            # Provider brownout: still return the retrieval results, just without a grade
+            logger.warning(f"Grading skipped, LLM unavailable: {e}")
+            answer = {}
+            grading_degraded = True
+
         except Exception as e:
             logger.error(f"Error calling Gemini: {e}")
-            answer = f"Error generating answer: {str(e)}"
-    return RetrieveResponse(results=formatted_results, answer=answer, ai_score=ai_score)
\ No newline at end of file
+            answer = {"error": f"Error generating answer: {str(e)}"}
+
+    ai_score = await ai_score_task if ai_score_task is not None else None
+    return RetrieveResponse(
+        results=formatted_results,
+        answer=answer,
+        ai_score=ai_score,
+        ai_score_id=ai_score_id,
+        grading_degraded=grading_degraded
+    )
+
+
+@instrumented("retrieval_batch")
+async def batch_retrieval(payload: RetrieveBatchRequest):
+    """
+    Bulk grading: runs retrieval() for every item, but scores all answers for AI content
+    together (deduplicated, one Redis round-trip, concurrent ZeroGPT calls).
+    """
+    # Reject the whole batch before any ZeroGPT call is spent on it
+    for item in payload.items:
+        _authorize(item.filters)
+
+    immediate = [item for item in payload.items if not item.defer_ai_score]
+    scores_task = asyncio.create_task(get_ai_scores([item.query for item in immediate]))
+
+    async def score_at(position):
+        return (await scores_task)[position]
+
+    semaphore = asyncio.Semaphore(RETRIEVE_BATCH_CONCURRENCY)
+
+    async def grade(item, position):
+        async with semaphore:
+            task = None if item.defer_ai_score else asyncio.ensure_future(score_at(position))
+            return await retrieval(item, ai_score_task=task)
+
+    positions = {id(item): position for position, item in enumerate(immediate)}
+    results = await asyncio.gather(*(grade(item, positions.get(id(item))) for item in payload.items))
+    return RetrieveBatchResponse(results=results)
\ No newline at end of file
@@ -0,0 +1,35 @@
+# Multi-worker serving mode: gunicorn master + uvicorn workers.
+#   gunicorn -c gunicorn.conf.py rag_server:app
+# Each worker is a separate process (one core each); caches that must be shared
+# across workers (query expansion, AI scores) live in Redis.
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Import the app (and heavy modules, see utils/preload.py) once in the master, then fork
+preload_app = os.getenv("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+# Prometheus: every worker writes its samples to this directory and /metrics aggregates them.
+# Must be set before prometheus_client is imported, i.e. before the app is loaded.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def on_starting(server):
+    if preload_app:
+        from utils.preload import preload_shared_state
+        preload_shared_state()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
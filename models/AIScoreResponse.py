@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class AIScoreResponse(BaseModel):
+    ai_score_id: str = Field(..., description="Content hash returned by /retrieve")
+    status: str = Field(..., description="ready, pending, failed (retry the /retrieve call) or not_found")
+    ai_score: Optional[float] = Field(None, description="A score out of 100 to detect whether content is AI written")
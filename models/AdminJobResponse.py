@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any
+
+
+class AdminJobResponse(BaseModel):
+    job_id: str = Field(..., description="Poll /admin/jobs/{job_id} for progress")
+    type: str = Field(..., description="delete or reindex")
+    test_id: str
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    params: Dict[str, Any] = {}
+    processed_sources: int = Field(0, description="Source documents re-indexed so far")
+    processed_chunks: int = Field(0, description="Chunks written to the new index version so far")
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
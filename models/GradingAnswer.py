@@ -0,0 +1,34 @@
+from pydantic import BaseModel, Field, ConfigDict
+from typing import List
+
+
+class CriterionScore(BaseModel):
+    criterion: str
+    score: int
+    max: int
+
+
+class UnsupportedClaim(BaseModel):
+    claim: str
+    suggested_penalty_points: int = 0
+
+
+class GradingEvidence(BaseModel):
+    supporting_doc_ids: List[str] = []
+    contradicting_doc_ids: List[str] = []
+    unsupported_claims: List[UnsupportedClaim] = []
+
+
+class GradingAnswer(BaseModel):
+    """
+    Structured grade returned by the LLM for /retrieve (serialized with the "pass" key).
+    """
+    model_config = ConfigDict(populate_by_name=True)
+
+    overall_score: int = Field(..., description="Overall score out of 100")
+    breakdown: List[CriterionScore] = Field(..., description="Per-criterion scores, summing to overall_score")
+    confidence: float = Field(0.0, description="How well the retrieved docs cover the question (0.0-1.0)")
+    pass_: bool = Field(..., alias="pass")
+    rationale: str = ""
+    improvements: List[str] = []
+    evidence: GradingEvidence = GradingEvidence()
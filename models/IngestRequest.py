@@ -1,6 +1,6 @@
 from fastapi import File, Form, UploadFile
 from pydantic import UUID4, BaseModel
-from typing import List
+from typing import List, Optional
 
 
 class IngestRequest(BaseModel):
@@ -8,4 +8,4 @@ class IngestRequest(BaseModel):
     tenant_id: UUID4 = Form(..., description="Unique identifier for the tenant"),
     metadata: str = Form("{}", description="JSON string of global metadata"),
     documents_json: str = Form("[]", description="JSON string list of DocumentSource (URLs/Text)"),
-    files: List[UploadFile] = File(None, description="List of binary files (PDF, DOCX, Images)")   
\ No newline at end of file
+    files: Optional[List[UploadFile]] = File(None, description="List of binary files (PDF, DOCX, Images)")   
\ No newline at end of file
@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional
+from utils.rag_initialization import SUPPORTED_EMBEDDING_MODELS
+
+
+class ReindexRequest(BaseModel):
+    """
+    Settings for rebuilding a test's index from its stored source text.
+    """
+    chunk_size: int = Field(1000, ge=100, le=8000, description="Characters per chunk")
+    chunk_overlap: int = Field(200, ge=0, description="Characters shared by consecutive chunks")
+    embedding_model: Optional[str] = Field(None, description="Google embedding model, e.g. models/text-embedding-004 (default)")
+
+    @field_validator("embedding_model")
+    @classmethod
+    def check_embedding_model(cls, embedding_model: Optional[str]):
+        # An unknown name would only fail deep inside the background job, after the rebuild started
+        if embedding_model is not None and embedding_model not in SUPPORTED_EMBEDDING_MODELS:
+            raise ValueError(f"embedding_model must be one of {', '.join(SUPPORTED_EMBEDDING_MODELS)}")
+        return embedding_model
+
+    @model_validator(mode="after")
+    def check_overlap(self):
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        return self
@@ -0,0 +1,10 @@
+from pydantic import BaseModel, Field
+from typing import List
+from models.RetrieveRequest import RetrieveRequest
+
+
+class RetrieveBatchRequest(BaseModel):
+    """
+    Bulk grading payload: several /retrieve requests scored in one call.
+    """
+    items: List[RetrieveRequest] = Field(..., min_length=1, max_length=100, description="Answers to grade")
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+from typing import List
+from models.RetrieveResponse import RetrieveResponse
+
+
+class RetrieveBatchResponse(BaseModel):
+    results: List[RetrieveResponse]
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+import uuid
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, Dict
 
 
@@ -9,4 +10,20 @@ class RetrieveRequest(BaseModel):
     question: str = Field(..., description="The question asked by the bot")
     query: str = Field(..., description="The candidate's chat message or query")
     filters: Dict[str, str] = Field(..., description="Must include test_id to filter scope")
-    top_k: int = Field(3, description="Number of relevant chunks to retrieve")
\ No newline at end of file
+    top_k: int = Field(3, description="Number of relevant chunks to retrieve")
+    defer_ai_score: bool = Field(False, description="Return immediately and compute ai_score in the background (fetch it from /ai-score/{ai_score_id})")
+
+    @field_validator("filters")
+    @classmethod
+    def check_ids(cls, filters: Dict[str, str]):
+        # test_id / tenant_id end up in collection names and snapshot paths: only the UUID4s /ingest accepts
+        for key in ("test_id", "tenant_id"):
+            if filters.get(key):
+                try:
+                    value = uuid.UUID(filters[key])
+                except ValueError:
+                    value = None
+                if value is None or value.version != 4:
+                    raise ValueError(f"filters.{key} must be a UUID4")
+                filters[key] = str(value)
+        return filters
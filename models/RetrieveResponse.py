@@ -1,10 +1,13 @@
 from pydantic import BaseModel
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from models.SearchResult import SearchResult
+from models.GradingAnswer import GradingAnswer
 
 
 class RetrieveResponse(BaseModel):
     results: List[SearchResult]
-    answer: Dict[str,Any] = Field(..., description="The generated answer from the LLM")
-    ai_score: float = Field(..., description="A score out of 100 to detect whether content is AI written")
\ No newline at end of file
+    answer: Union[GradingAnswer, Dict[str,Any]] = Field(..., description="The LLM grade ({} when degraded, {\"error\": ...} on failure)")
+    ai_score: Optional[float] = Field(None, description="A score out of 100 to detect whether content is AI written (null when deferred)")
+    ai_score_id: Optional[str] = Field(None, description="Content hash of the answer, used to fetch a deferred score from /ai-score/{ai_score_id}")
+    grading_degraded: bool = Field(False, description="True when the LLM was unavailable and 'answer' carries no grade")
\ No newline at end of file
@@ -3,21 +3,32 @@ from pydantic import UUID4
 import uvicorn
 from loguru import logger
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, File, HTTPException, UploadFile, Form
+from fastapi import FastAPI, File, HTTPException, UploadFile, Form, Request, Response
 from typing import List
 from controllers.ingestion import ingestion
-from controllers.retrieval import retrieval
+from controllers.retrieval import retrieval, batch_retrieval
 from controllers.question_generation import question_generation
-from security.auth import verify_token
+from controllers.admin import delete_test_data, reindex_test_data, admin_job_status
+from security.auth import verify_token, require_admin, load_verification_keys
 from fastapi import Depends
 from models.IngestResponse import IngestResponse
 from models.IngestRequest import IngestRequest
 from models.RetrieveRequest import RetrieveRequest
 from models.RetrieveResponse import RetrieveResponse
+from models.RetrieveBatchRequest import RetrieveBatchRequest
+from models.RetrieveBatchResponse import RetrieveBatchResponse
+from models.AIScoreResponse import AIScoreResponse
 from models.QuestionGenerationResponse import QuestionGenerationResponse
 from models.QuestionGenerationRequest import QuestionGenerationRequest
+from models.ReindexRequest import ReindexRequest
+from models.AdminJobResponse import AdminJobResponse
 from utils.rag_initialization import rag_initialization
 from utils.redis_init import redis_init
+from utils.ai_detection import lookup_ai_score
+from utils.test_ai_content import close_http_client
+from utils.metrics import tracing_init, render_metrics, tracer
+from utils.llm_client import start_request_deadline, reset_request_deadline
+from utils.test_lifecycle import start_retirement_sweeper
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -25,6 +36,11 @@ async def lifespan(app: FastAPI):
     This function runs BEFORE the server starts accepting requests.
     It is the perfect place to load ML models and DB connections.
     """
+    tracing_init()
+
+    # Parse JWT public keys once; verify_token only does (cached) signature checks afterwards
+    load_verification_keys()
+
     logger.info("startup: Triggering RAG Initialization...")
     try:
         # Run your initialization logic here
@@ -42,11 +58,15 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.critical(f"startup: CRITICAL ERROR during redist initialization: {e}")
         raise e
+
+    # Drops index versions replaced by a re-index once no worker can still write to them
+    start_retirement_sweeper()
     
     yield # The server runs and handles requests here
     
     # (Optional) Code here runs when the server shuts down
     logger.info("shutdown: Cleaning up resources...")
+    await close_http_client()
 
 
 # --- Configuration ---
@@ -59,6 +79,20 @@ app = FastAPI(
 
 
 
+@app.middleware("http")
+async def request_span(request: Request, call_next):
+    """
+    Wraps every request in a trace span (no-op unless TRACING_ENABLED is set)
+    and starts the deadline budget shared by all LLM calls of the request.
+    """
+    deadline_token = start_request_deadline()
+    try:
+        with tracer.start_as_current_span(f"{request.method} {request.url.path}"):
+            return await call_next(request)
+    finally:
+        reset_request_deadline(deadline_token)
+
+
 # --- API Endpoints ---
 
 @app.post("/ingest", response_model=IngestResponse, status_code=202, dependencies=[Depends(verify_token)])
@@ -91,16 +125,48 @@ async def ingest_content(
 async def retrieve_context(payload: RetrieveRequest):
     return await retrieval(payload)
 
+@app.post("/retrieve/batch", response_model=RetrieveBatchResponse, dependencies=[Depends(verify_token)])
+async def retrieve_context_batch(payload: RetrieveBatchRequest):
+    return await batch_retrieval(payload)
+
+@app.get("/ai-score/{ai_score_id}", response_model=AIScoreResponse, dependencies=[Depends(verify_token)])
+async def fetch_ai_score(ai_score_id: str):
+    """Fetches an AI-content score computed in the background (retrieve with defer_ai_score=true)"""
+    status, score = lookup_ai_score(ai_score_id)
+    return AIScoreResponse(ai_score_id=ai_score_id, status=status, ai_score=score)
+
 @app.post("/generate-questions", response_model=QuestionGenerationResponse, dependencies=[Depends(verify_token)])
 async def generate_questions(payload: QuestionGenerationRequest):
     return await question_generation(payload)
         
 
+# --- Admin Endpoints (token must carry the admin role, see security/auth.py) ---
+
+@app.delete("/admin/tests/{test_id}", response_model=AdminJobResponse, status_code=202, dependencies=[Depends(require_admin)])
+async def delete_test(test_id: UUID4):
+    """Deletes all vectors of a test in the background"""
+    return await delete_test_data(test_id)
+
+@app.post("/admin/tests/{test_id}/reindex", response_model=AdminJobResponse, status_code=202, dependencies=[Depends(require_admin)])
+async def reindex_test(test_id: UUID4, payload: ReindexRequest):
+    """Rebuilds a test's index with new chunking / embedding settings in the background"""
+    return await reindex_test_data(test_id, payload)
+
+@app.get("/admin/jobs/{job_id}", response_model=AdminJobResponse, dependencies=[Depends(require_admin)])
+async def fetch_admin_job(job_id: str):
+    return await admin_job_status(job_id)
+
 
 @app.get("/health")
 async def health_check():
     """Health check for k8s/monitoring"""
     return {"status": "operational", "service": "rag-pipeline"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: per-stage latency, cache hits, batch sizes, LLM tokens"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     uvicorn.run("rag_server:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Maintenance tool for per-test collections (see utils/vector_store.py).
+
+    python -m scripts.partitions migrate                 # move every test out of rag_knowledge_base_v1
+    python -m scripts.partitions migrate --test-id <id>  # move selected tests only
+    python -m scripts.partitions migrate --keep-shared   # copy, leave the shared rows in place
+    python -m scripts.partitions migrate --dry-run       # list the tests that would be moved
+    python -m scripts.partitions delete <test_id>        # drop every chunk (and the local snapshot) of a test
+    python -m scripts.partitions retire                  # drop index versions left behind by re-indexes, now
+    python -m scripts.partitions retire --test-id <id>   # selected tests only
+
+Migration is idempotent (chunks are upserted by id) and a test stays readable from the shared
+collection until its partition holds all of its chunks, so it can run while the service is live.
+Uses the same environment (.env) as the service.
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from utils.rag_initialization import rag_initialization
+from utils.redis_init import redis_init
+from utils.index_snapshot import delete_snapshot
+from utils.vector_store import migrate_test, delete_test, list_shared_test_ids, list_partitioned_test_ids, partitioning_enabled
+from utils.test_lifecycle import retire_pending
+
+
+def migrate(args):
+    if not partitioning_enabled():
+        logger.error("VECTOR_PARTITIONING is not 'test', nothing to migrate to")
+        return 1
+
+    test_ids = args.test_id or list_shared_test_ids()
+    logger.info(f"{len(test_ids)} tests to migrate")
+    if args.dry_run:
+        for test_id in test_ids:
+            print(test_id)
+        return 0
+
+    failed = 0
+    for position, test_id in enumerate(test_ids, start=1):
+        try:
+            migrate_test(test_id, delete_shared=not args.keep_shared)
+            logger.info(f"[{position}/{len(test_ids)}] {test_id} done")
+        except Exception as e:
+            failed += 1
+            logger.error(f"[{position}/{len(test_ids)}] {test_id} failed: {e}")
+    return 1 if failed else 0
+
+
+def delete(args):
+    deleted = delete_test(args.test_id)
+    delete_snapshot(args.test_id)
+    print(f"Deleted {deleted} chunks of Test ID {args.test_id}")
+    return 0
+
+
+def retire(args):
+    # Only for versions no worker routes to anymore: normally the service retires them itself
+    # VERSION_RETIRE_DELAY_SECONDS after a swap; this re-drives what a restart without Redis lost
+    test_ids = args.test_id or list_partitioned_test_ids()
+    failed = 0
+    for test_id in test_ids:
+        try:
+            retired = retire_pending(test_id)
+            if retired:
+                logger.info(f"{test_id}: retired {retired} versions")
+        except Exception as e:
+            failed += 1
+            logger.error(f"{test_id} failed: {e}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-test collection maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Move tests from the shared collection into their own collections")
+    migrate_parser.add_argument("--test-id", action="append", help="Only migrate this test (repeatable)")
+    migrate_parser.add_argument("--keep-shared", action="store_true", help="Do not delete the migrated rows from the shared collection")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Only list the tests that would be migrated")
+    migrate_parser.set_defaults(handler=migrate)
+
+    delete_parser = commands.add_parser("delete", help="Delete every chunk of a test")
+    delete_parser.add_argument("test_id")
+    delete_parser.set_defaults(handler=delete)
+
+    retire_parser = commands.add_parser("retire", help="Drain and drop the retiring index versions of tests")
+    retire_parser.add_argument("--test-id", action="append", help="Only this test (repeatable)")
+    retire_parser.set_defaults(handler=retire)
+
+    args = parser.parse_args()
+    rag_initialization()
+    redis_init()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
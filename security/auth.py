@@ -1,39 +1,185 @@
 import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
 import jwt
-from fastapi import HTTPException, Security, status
+from cachetools import TLRUCache
+from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from loguru import logger
+from utils.metrics import record_cache
 
 load_dotenv()
 
 security = HTTPBearer()
 SECRET_KEY = os.getenv("SECRET_KEY")
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
+# Accepted algorithms. HS* use SECRET_KEY; RS*/ES*/PS*/EdDSA use the public keys below.
+JWT_ALGORITHMS = [a.strip() for a in os.getenv("JWT_ALGORITHMS", "HS256").split(",") if a.strip()]
+# Public keys for asymmetric tokens: a JWKS file (selected by the token's "kid" header, supports rotation)
+# and/or a single PEM public key (used for tokens without a kid, or with kid == JWT_PUBLIC_KEY_ID).
+JWT_JWKS_FILE = os.getenv("JWT_JWKS_FILE")
+JWT_PUBLIC_KEY_FILE = os.getenv("JWT_PUBLIC_KEY_FILE")
+JWT_PUBLIC_KEY_ID = os.getenv("JWT_PUBLIC_KEY_ID")
+JWT_KEY_RELOAD_INTERVAL = float(os.getenv("JWT_KEY_RELOAD_INTERVAL", "60"))  # min seconds between reloads on unknown kid
+
+# Admin endpoints additionally require this claim (string or list) to contain one of ADMIN_ROLES
+ADMIN_CLAIM = os.getenv("ADMIN_CLAIM", "role")
+ADMIN_ROLES = {r.strip() for r in os.getenv("ADMIN_ROLES", "admin").split(",") if r.strip()}
+
+# Verified-token cache: keyed by SHA-256 of the token, entries expire at the token's exp
+# (or after AUTH_CACHE_MAX_TTL for tokens without exp), LRU-evicted beyond AUTH_CACHE_SIZE.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_MAX_TTL = float(os.getenv("AUTH_CACHE_MAX_TTL", "300"))
+
+_token_cache = TLRUCache(maxsize=AUTH_CACHE_SIZE, ttu=lambda key, value, now: value[1], timer=time.time)
+_cache_lock = threading.Lock()
+
+_public_keys = {}
+_keys_loaded_at = 0.0
+_keys_lock = threading.Lock()
+
+
+class UnknownKeyError(jwt.InvalidKeyError):
+    """The token's kid matches none of the loaded public keys"""
+
+
+def load_verification_keys():
+    """
+    Parses the configured public keys once (PEM/JWK parsing is far more expensive than verification).
+    Called at startup and again, rate limited, when a token references an unknown kid (key rotation).
+    """
+    global _public_keys, _keys_loaded_at
+
+    keys = {}
+    if JWT_JWKS_FILE:
+        with open(JWT_JWKS_FILE) as f:
+            jwks = jwt.PyJWKSet.from_dict(json.load(f))
+        for jwk in jwks.keys:
+            keys[jwk.key_id] = jwk.key
+
+    if JWT_PUBLIC_KEY_FILE:
+        from cryptography.hazmat.primitives.serialization import load_pem_public_key
+        with open(JWT_PUBLIC_KEY_FILE, "rb") as f:
+            pem_key = load_pem_public_key(f.read())
+        keys[JWT_PUBLIC_KEY_ID] = pem_key
+        keys[None] = pem_key  # tokens without a kid header
+
+    with _keys_lock:
+        removed = [kid for kid, key in _public_keys.items() if keys.get(kid) != key]
+        _public_keys = keys
+        _keys_loaded_at = time.monotonic()
+
+    if removed:
+        # A key was rotated out (e.g. revoked): tokens verified with it must be checked again
+        with _cache_lock:
+            _token_cache.clear()
+
+    if keys:
+        logger.info(f"Loaded {len(keys)} JWT verification key(s): {sorted(str(k) for k in keys)}")
+
+
+def _resolve_key(token: str):
+    """Picks the verification key from the (unverified) header; the signature check happens in jwt.decode"""
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    if algorithm not in JWT_ALGORITHMS:
+        raise jwt.InvalidAlgorithmError(f"Algorithm {algorithm} not allowed")
+
+    if algorithm.startswith("HS"):
+        if not SECRET_KEY:
+            raise jwt.InvalidKeyError("SECRET_KEY not set for HMAC tokens")
+        return SECRET_KEY, algorithm
+
+    kid = header.get("kid")
+    key = _public_keys.get(kid)
+    if key is None:
+        raise UnknownKeyError(f"Unknown key id: {kid}")
+    return key, algorithm
+
+
+def _claim_reload() -> bool:
+    """True for at most one caller per JWT_KEY_RELOAD_INTERVAL, so a burst of unknown kids reads the files once"""
+    global _keys_loaded_at
+    with _keys_lock:
+        if time.monotonic() - _keys_loaded_at < JWT_KEY_RELOAD_INTERVAL:
+            return False
+        _keys_loaded_at = time.monotonic()
+        return True
+
+
+async def _reload_keys():
+    """Possibly a freshly rotated key: re-reads the key files off the event loop"""
+    try:
+        await asyncio.to_thread(load_verification_keys)
+    except Exception as e:
+        logger.error(f"Failed to reload JWT verification keys, keeping the previous set: {e}")
+
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
     Validates the JWT token from the Authorization header.
+    Async on purpose: a cache hit is a dict lookup, not worth a threadpool hop.
     """
-    if not SECRET_KEY:
+    if not SECRET_KEY and not (JWT_JWKS_FILE or JWT_PUBLIC_KEY_FILE):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Server configuration error: SECRET_KEY not set"
         )
 
     token = credentials.credentials
+    cache_key = hashlib.sha256(token.encode("utf-8")).digest()
+
+    with _cache_lock:
+        cached = _token_cache.get(cache_key)
+    record_cache("jwt", cached is not None)
+    if cached is not None:
+        return dict(cached[0])
+
     try:
-        # We only verify the signature using the SECRET_KEY.
+        # We only verify the signature (and exp/nbf when present).
         # We don't enforce specific claims unless required.
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return payload
+        try:
+            key, algorithm = _resolve_key(token)
+        except UnknownKeyError:
+            if not _claim_reload():
+                raise
+            await _reload_keys()
+            key, algorithm = _resolve_key(token)
+        payload = jwt.decode(token, key, algorithms=[algorithm])
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token has expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except jwt.InvalidTokenError:
+    except (jwt.InvalidTokenError, jwt.InvalidKeyError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Only successful verifications are cached, and never beyond the token's own expiry
+    expires_at = time.time() + AUTH_CACHE_MAX_TTL
+    if isinstance(payload.get("exp"), (int, float)):
+        expires_at = min(expires_at, payload["exp"])
+    with _cache_lock:
+        _token_cache[cache_key] = (payload, expires_at)
+
+    return dict(payload)
+
+
+async def require_admin(payload: dict = Depends(verify_token)):
+    """Dependency for /admin endpoints: a valid token whose ADMIN_CLAIM grants one of ADMIN_ROLES"""
+    claim = payload.get(ADMIN_CLAIM)
+    roles = set(claim) if isinstance(claim, (list, tuple)) else {claim}
+    if not roles & ADMIN_ROLES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return payload
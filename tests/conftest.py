@@ -0,0 +1,89 @@
+"""
+Shared fixtures. The tests run offline against the stand-ins from benchmarks/stubs.py:
+
+    pip install -r requirements.txt -r tests/requirements.txt
+    python -m pytest -q
+"""
+import os
+import sys
+
+# The app reads these at import time, so set them before importing it
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("TRACING_ENABLED", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmarks.stubs import FakeGenAI, LatencyModel
+
+
+class ScriptedGenAI(FakeGenAI):
+    """
+    FakeGenAI whose generate_content plays back `outcomes`, one per call: an exception is raised,
+    a number is extra latency (seconds) before the canned answer. Calls past the script just answer.
+    """
+
+    def __init__(self, outcomes=(), latency: LatencyModel = None):
+        super().__init__(latency or LatencyModel(0, 0))
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def GenerativeModel(self, model_name: str = "gemini-2.5-flash", **kwargs):
+        model = super().GenerativeModel(model_name, **kwargs)
+        answer = model.generate_content
+
+        def generate_content(contents, **call_kwargs):
+            self.calls += 1
+            outcome = self.outcomes.pop(0) if self.outcomes else None
+            if isinstance(outcome, BaseException):
+                raise outcome
+            if outcome:
+                LatencyModel(outcome).sleep()
+            return answer(contents, **call_kwargs)
+
+        model.generate_content = generate_content
+        return model
+
+
+@pytest.fixture
+def scripted_genai(monkeypatch):
+    """Installs a ScriptedGenAI; call the returned factory with the outcomes of the next calls"""
+    import utils.rag_initialization as rag_state
+    import utils.llm_client as llm_client
+
+    def install(*outcomes, latency: LatencyModel = None):
+        genai = ScriptedGenAI(outcomes, latency)
+        monkeypatch.setattr(rag_state, "genai", genai)
+        llm_client.get_model.cache_clear()
+        return genai
+
+    yield install
+    llm_client.get_model.cache_clear()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    import fakeredis
+    import utils.redis_init as redis_state
+
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_state, "redis_client", client)
+    return client
+
+
+@pytest.fixture
+def chroma(monkeypatch):
+    """In-memory Chroma with a fresh shared collection and small deterministic embeddings"""
+    import uuid
+    import chromadb
+    import utils.rag_initialization as rag_state
+    import utils.vector_store as vector_store
+    from benchmarks.stubs import HashEmbedder
+
+    client = chromadb.EphemeralClient()
+    monkeypatch.setattr(rag_state, "chroma_client", client)
+    monkeypatch.setattr(rag_state, "collection", client.get_or_create_collection(name=f"shared_{uuid.uuid4().hex}"))
+    monkeypatch.setattr(rag_state, "embedding_model", HashEmbedder(LatencyModel(0, 0), dim=8))
+    vector_store._routes.clear()
+    yield client
+    vector_store._routes.clear()
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+from cachetools import TTLCache
+
+import utils.ai_detection as ai_detection
+from utils.ai_detection import content_hash, get_ai_score, get_ai_scores, lookup_ai_score, schedule_ai_score
+
+
+class FakeZeroGPT:
+    """Counts calls per text; scores are len(text) unless the text is listed in `fail`"""
+
+    def __init__(self, delay: float = 0.0, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = []
+
+    async def __call__(self, text: str) -> float:
+        self.calls.append(text)
+        await asyncio.sleep(self.delay)
+        return -1 if text in self.fail else float(len(text))
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(ai_detection, "_local_cache", TTLCache(maxsize=100, ttl=3600))
+    monkeypatch.setattr(ai_detection, "_local_failures", TTLCache(maxsize=100, ttl=3600))
+    monkeypatch.setattr(ai_detection, "_in_flight", {})
+    monkeypatch.setattr(ai_detection, "_background_tasks", set())
+    monkeypatch.setattr(ai_detection, "_semaphore", None)
+    monkeypatch.setattr(ai_detection.redis_state, "redis_client", None)
+
+
+@pytest.fixture
+def zero_gpt(monkeypatch):
+    def install(**kwargs):
+        fake = FakeZeroGPT(**kwargs)
+        monkeypatch.setattr(ai_detection, "zero_gpt_test", fake)
+        return fake
+    return install
+
+
+# --- Caching ---
+
+def test_score_is_cached_locally(zero_gpt):
+    fake = zero_gpt()
+    assert asyncio.run(get_ai_score("an answer")) == 9.0
+    assert asyncio.run(get_ai_score("an answer")) == 9.0
+    assert fake.calls == ["an answer"]
+
+
+def test_score_is_shared_through_redis(zero_gpt, fake_redis, monkeypatch):
+    fake = zero_gpt()
+    asyncio.run(get_ai_score("an answer"))
+    assert fake_redis.get(ai_detection.REDIS_SCORE_PREFIX + content_hash("an answer")) == "9.0"
+
+    # Another worker: empty local cache, same Redis
+    monkeypatch.setattr(ai_detection, "_local_cache", TTLCache(maxsize=100, ttl=3600))
+    assert asyncio.run(get_ai_score("an answer")) == 9.0
+    assert len(fake.calls) == 1
+
+
+def test_failures_are_not_cached(zero_gpt, fake_redis):
+    fake = zero_gpt(fail={"an answer"})
+    assert asyncio.run(get_ai_score("an answer")) == -1
+    assert asyncio.run(get_ai_score("an answer")) == -1
+    assert len(fake.calls) == 2
+    assert fake_redis.get(ai_detection.REDIS_SCORE_PREFIX + content_hash("an answer")) is None
+
+
+# --- Single flight ---
+
+def test_concurrent_requests_share_one_call(zero_gpt):
+    fake = zero_gpt(delay=0.05)
+
+    async def burst():
+        return await asyncio.gather(*(get_ai_score("same answer") for _ in range(10)))
+
+    assert asyncio.run(burst()) == [11.0] * 10
+    assert len(fake.calls) == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call(zero_gpt):
+    zero_gpt(delay=0.05)
+
+    async def cancel_one():
+        first = asyncio.create_task(get_ai_score("same answer"))
+        second = asyncio.create_task(get_ai_score("same answer"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(cancel_one()) == 11.0
+
+
+# --- Batch ---
+
+def test_batch_dedups_and_fetches_redis_in_one_mget(zero_gpt, fake_redis, monkeypatch):
+    fake = zero_gpt()
+    fake_redis.set(ai_detection.REDIS_SCORE_PREFIX + content_hash("cached"), 42.0)
+    mgets = []
+    real_mget = fake_redis.mget
+    monkeypatch.setattr(fake_redis, "mget", lambda keys: mgets.append(keys) or real_mget(keys))
+
+    scores = asyncio.run(get_ai_scores(["cached", "fresh", "fresh", "cached"]))
+    assert scores == [42.0, 5.0, 5.0, 42.0]
+    assert fake.calls == ["fresh"]
+    assert len(mgets) == 1 and len(mgets[0]) == 2
+
+
+# --- Deferred scores ---
+
+def test_deferred_score_is_pending_then_ready(zero_gpt, fake_redis):
+    zero_gpt(delay=0.05)
+
+    async def defer():
+        digest = schedule_ai_score("an answer")
+        assert lookup_ai_score(digest) == ("pending", None)
+        await asyncio.gather(*ai_detection._background_tasks)
+        return digest
+
+    digest = asyncio.run(defer())
+    assert lookup_ai_score(digest) == ("ready", 9.0)
+    assert not fake_redis.exists(ai_detection.REDIS_PENDING_PREFIX + digest)
+
+
+def test_deferred_failure_is_reported(zero_gpt, fake_redis, monkeypatch):
+    zero_gpt(fail={"an answer"})
+
+    async def defer():
+        digest = schedule_ai_score("an answer")
+        await asyncio.gather(*ai_detection._background_tasks)
+        return digest
+
+    digest = asyncio.run(defer())
+    assert lookup_ai_score(digest) == ("failed", None)
+    assert fake_redis.ttl(ai_detection.REDIS_FAILED_PREFIX + digest) <= ai_detection.AI_SCORE_FAILED_TTL
+
+    # Another worker sees it through Redis; once the marker expires the id is unknown
+    monkeypatch.setattr(ai_detection, "_local_failures", TTLCache(maxsize=100, ttl=3600))
+    assert lookup_ai_score(digest) == ("failed", None)
+    fake_redis.delete(ai_detection.REDIS_FAILED_PREFIX + digest)
+    assert lookup_ai_score(digest) == ("not_found", None)
+
+
+def test_retry_after_failure_clears_the_marker(zero_gpt, fake_redis):
+    fake = zero_gpt(fail={"an answer"})
+    asyncio.run(get_ai_score("an answer"))
+    fake.fail.clear()
+
+    assert asyncio.run(get_ai_score("an answer")) == 9.0
+    digest = content_hash("an answer")
+    assert lookup_ai_score(digest) == ("ready", 9.0)
+    assert not fake_redis.exists(ai_detection.REDIS_FAILED_PREFIX + digest)
+
+
+def test_unknown_id_is_not_found(fake_redis):
+    assert lookup_ai_score(content_hash("never scored")) == ("not_found", None)
@@ -0,0 +1,146 @@
+import json
+import time
+import asyncio
+
+import jwt
+import pytest
+from cachetools import TLRUCache
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import security.auth as auth
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth, "_token_cache", TLRUCache(maxsize=100, ttu=lambda key, value, now: value[1], timer=clock))
+    monkeypatch.setattr(auth, "SECRET_KEY", "test-secret")
+    monkeypatch.setattr(auth, "JWT_ALGORITHMS", ["HS256", "ES256"])
+    monkeypatch.setattr(auth, "JWT_JWKS_FILE", None)
+    monkeypatch.setattr(auth, "JWT_PUBLIC_KEY_FILE", None)
+    monkeypatch.setattr(auth, "JWT_PUBLIC_KEY_ID", None)
+    monkeypatch.setattr(auth, "_public_keys", {})
+    monkeypatch.setattr(auth, "_keys_loaded_at", 0.0)
+    return clock
+
+
+@pytest.fixture
+def jwks(tmp_path, monkeypatch):
+    """Writes the given {kid: private_key} set as a JWKS file and points the module at it"""
+    path = tmp_path / "jwks.json"
+    monkeypatch.setattr(auth, "JWT_JWKS_FILE", str(path))
+
+    def write(keys: dict):
+        path.write_text(json.dumps({"keys": [
+            {**jwt.algorithms.ECAlgorithm.to_jwk(key.public_key(), as_dict=True), "kid": kid}
+            for kid, key in keys.items()
+        ]}))
+    return write
+
+
+def verify(token: str) -> dict:
+    return asyncio.run(auth.verify_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)))
+
+
+def es_token(key, kid=None, **claims) -> str:
+    headers = {"kid": kid} if kid else None
+    return jwt.encode({"sub": "user", **claims}, key, algorithm="ES256", headers=headers)
+
+
+def new_key():
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+# --- Verified-token cache ---
+
+def test_cache_entry_never_outlives_the_token(clock, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_CACHE_MAX_TTL", 300)
+    exp = int(clock.now) + 60
+    token = jwt.encode({"sub": "user", "exp": exp}, "test-secret", algorithm="HS256")
+    assert verify(token)["sub"] == "user"
+    assert [value[1] for value in auth._token_cache.values()] == [exp]
+
+    # A changed secret proves the next answer comes from the cache...
+    monkeypatch.setattr(auth, "SECRET_KEY", "rotated-secret")
+    clock.now = exp - 1
+    assert verify(token)["sub"] == "user"
+
+    # ...until the token's own exp, even though AUTH_CACHE_MAX_TTL is longer
+    clock.now = exp
+    with pytest.raises(HTTPException) as error:
+        verify(token)
+    assert error.value.status_code == 401
+
+
+def test_expired_token_is_rejected_and_not_cached(clock):
+    token = jwt.encode({"sub": "user", "exp": int(time.time()) - 10}, "test-secret", algorithm="HS256")
+    with pytest.raises(HTTPException, match="expired"):
+        verify(token)
+    assert len(auth._token_cache) == 0
+
+
+# --- Public keys ---
+
+def test_pem_key_verifies_tokens_without_kid(clock, tmp_path, monkeypatch):
+    key = new_key()
+    pem = tmp_path / "public.pem"
+    pem.write_bytes(key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+    monkeypatch.setattr(auth, "JWT_PUBLIC_KEY_FILE", str(pem))
+    monkeypatch.setattr(auth, "JWT_PUBLIC_KEY_ID", "pem-1")
+    auth.load_verification_keys()
+
+    assert verify(es_token(key))["sub"] == "user"
+    assert verify(es_token(key, kid="pem-1"))["sub"] == "user"
+
+
+def test_unknown_kid_reloads_rotated_keys(clock, jwks, monkeypatch):
+    old, new = new_key(), new_key()
+    jwks({"old": old})
+    auth.load_verification_keys()
+    jwks({"old": old, "new": new})
+
+    # Within the reload interval the files are not re-read
+    monkeypatch.setattr(auth, "JWT_KEY_RELOAD_INTERVAL", 3600)
+    with pytest.raises(HTTPException):
+        verify(es_token(new, kid="new"))
+
+    monkeypatch.setattr(auth, "JWT_KEY_RELOAD_INTERVAL", 0)
+    assert verify(es_token(new, kid="new"))["sub"] == "user"
+    assert set(auth._public_keys) == {"old", "new"}
+
+
+def test_removed_key_drops_cached_tokens(clock, jwks):
+    revoked, kept = new_key(), new_key()
+    jwks({"revoked": revoked, "kept": kept})
+    auth.load_verification_keys()
+    token = es_token(revoked, kid="revoked")
+    assert verify(token)["sub"] == "user"
+
+    jwks({"kept": kept})
+    auth.load_verification_keys()
+    assert len(auth._token_cache) == 0
+    with pytest.raises(HTTPException) as error:
+        verify(token)
+    assert error.value.status_code == 401
+
+
+def test_reload_keeps_cache_when_no_key_was_removed(clock, jwks):
+    key = new_key()
+    jwks({"a": key})
+    auth.load_verification_keys()
+    verify(es_token(key, kid="a"))
+
+    jwks({"a": key, "b": new_key()})
+    auth.load_verification_keys()
+    assert len(auth._token_cache) == 1
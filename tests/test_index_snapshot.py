@@ -0,0 +1,177 @@
+import os
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import utils.index_snapshot as index_snapshot
+from utils.index_snapshot import build_snapshot, delete_snapshot, open_snapshot, record_ingestion
+
+DIM = 4
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch, fake_redis):
+    monkeypatch.setattr(index_snapshot, "INDEX_SNAPSHOT_DIR", str(tmp_path))
+    index_snapshot._open_snapshots.clear()
+    yield tmp_path
+    index_snapshot._open_snapshots.clear()
+
+
+@pytest.fixture
+def no_redis(monkeypatch):
+    """Without Redis there is no shared generation to make a snapshot stale"""
+    monkeypatch.setattr(index_snapshot.redis_state, "redis_client", None)
+
+
+@pytest.fixture
+def test_id():
+    return str(uuid.uuid4())
+
+
+def rows(*names):
+    """One unit vector per row, so a query for row i finds exactly row i"""
+    embeddings = np.zeros((len(names), DIM), dtype=np.float32)
+    for i, name in enumerate(names):
+        embeddings[i, int(name[-1]) % DIM] = 1.0
+    return (
+        list(names),
+        embeddings,
+        [f"text of {name}" for name in names],
+        [{"chunk_index": i, "note": "ünïcode"} for i, _ in enumerate(names)],
+    )
+
+
+def stored_pages(monkeypatch, *pages, collection_name: str = "rag_test_live"):
+    """Stands in for Chroma: build_snapshot pages through these, routed to `collection_name`"""
+    def iter_test_pages(test_id, include=("documents",), **kwargs):
+        for ids, embeddings, documents, metadatas in pages:
+            yield {"ids": ids, "embeddings": embeddings.tolist(), "documents": documents, "metadatas": metadatas}
+    monkeypatch.setattr(index_snapshot, "iter_test_pages", iter_test_pages)
+    monkeypatch.setattr(index_snapshot, "resolve_collection", lambda test_id: (SimpleNamespace(name=collection_name), None))
+
+
+def all_ids(snapshot):
+    return [snapshot.ids[i] for i in range(snapshot.count)]
+
+
+def test_build_then_query(snapshot_dir, monkeypatch, test_id):
+    stored_pages(monkeypatch, rows("c0", "c1"), rows("c2"))
+    build_snapshot(test_id)
+
+    snapshot = open_snapshot(test_id)
+    assert snapshot.count == 3
+    assert all_ids(snapshot) == ["c0", "c1", "c2"]
+
+    result = snapshot.query(np.eye(DIM, dtype=np.float32)[1], 1)
+    assert result["ids"] == [["c1"]]
+    assert result["documents"] == [["text of c1"]]
+    assert result["metadatas"] == [[{"chunk_index": 1, "note": "ünïcode"}]]
+
+
+def test_ingestion_appends_and_reopens(snapshot_dir, monkeypatch, test_id):
+    stored_pages(monkeypatch, rows("c0"))
+    build_snapshot(test_id)
+    assert open_snapshot(test_id).count == 1
+
+    record_ingestion(test_id, *rows("c1", "c2"))
+
+    snapshot = open_snapshot(test_id)
+    assert snapshot.count == 3
+    assert snapshot.generation == 1
+    assert all_ids(snapshot) == ["c0", "c1", "c2"]
+    assert snapshot.documents[2] == "text of c2"
+
+
+def test_torn_tail_is_truncated_on_next_append(snapshot_dir, monkeypatch, test_id):
+    stored_pages(monkeypatch, rows("c0"))
+    build_snapshot(test_id)
+
+    # A writer that crashed mid-append leaves bytes past manifest["count"] behind
+    path = os.path.join(snapshot_dir, test_id)
+    for name in ("vectors.f32", "ids.bin", "ids.offsets", "documents.bin"):
+        with open(os.path.join(path, name), "ab") as f:
+            f.write(b"\xff" * 13)
+    assert all_ids(open_snapshot(test_id)) == ["c0"]
+
+    record_ingestion(test_id, *rows("c1"))
+    snapshot = open_snapshot(test_id)
+    assert all_ids(snapshot) == ["c0", "c1"]
+    assert snapshot.documents[1] == "text of c1"
+    assert os.path.getsize(os.path.join(path, "vectors.f32")) == 2 * DIM * 4
+    assert snapshot.query(np.eye(DIM, dtype=np.float32)[1], 1)["ids"] == [["c1"]]
+
+
+def test_other_pod_ingestion_makes_snapshot_stale(snapshot_dir, monkeypatch, fake_redis, test_id):
+    stored_pages(monkeypatch, rows("c0"))
+    build_snapshot(test_id)
+    fake_redis.incr(index_snapshot.REDIS_GENERATION_PREFIX + test_id)
+
+    assert open_snapshot(test_id) is None
+    # The missed rows can't be appended on top; the snapshot waits for a rebuild
+    record_ingestion(test_id, *rows("c1"))
+    assert open_snapshot(test_id) is None
+
+
+def test_rows_already_paged_by_a_build_are_not_appended_twice(snapshot_dir, monkeypatch, test_id):
+    # The ingestion stored c1 in Chroma, a build paged it in, then the ingestion bumped the generation
+    stored_pages(monkeypatch, rows("c0", "c1"))
+    build_snapshot(test_id)
+    record_ingestion(test_id, *rows("c1", "c2"))
+
+    snapshot = open_snapshot(test_id)
+    assert all_ids(snapshot) == ["c0", "c1", "c2"]
+    assert snapshot.generation == 1
+
+
+def test_ingestion_during_a_rebuild_does_not_wait(snapshot_dir, monkeypatch, no_redis, test_id):
+    stored_pages(monkeypatch, rows("c0"))
+    build_snapshot(test_id)
+
+    # A rebuild holds the lock while it pages Chroma; the ingestion flags the snapshot instead of waiting
+    with index_snapshot._test_lock(test_id) as acquired:
+        assert acquired
+        record_ingestion(test_id, *rows("c1"))
+    assert open_snapshot(test_id) is None
+
+    # The next rebuild pages the new rows in and clears the flag
+    stored_pages(monkeypatch, rows("c0", "c1"))
+    build_snapshot(test_id)
+    assert all_ids(open_snapshot(test_id)) == ["c0", "c1"]
+
+
+def test_snapshot_of_another_collection_is_ignored(snapshot_dir, monkeypatch, test_id):
+    # Built from the previous index version, e.g. by a worker that had not seen the swap yet
+    stored_pages(monkeypatch, rows("c0"), collection_name="rag_test_old")
+    build_snapshot(test_id)
+
+    assert open_snapshot(test_id, "rag_test_old").count == 1
+    assert open_snapshot(test_id, "rag_test_new") is None
+
+    # Rows written to another version are never appended: the snapshot just goes stale
+    record_ingestion(test_id, *rows("c1"), collection_name="rag_test_new")
+    assert index_snapshot._read_manifest(os.path.join(snapshot_dir, test_id))["count"] == 1
+    assert open_snapshot(test_id, "rag_test_old") is None
+
+
+def test_delete_snapshot(snapshot_dir, monkeypatch, fake_redis, test_id):
+    stored_pages(monkeypatch, rows("c0"))
+    build_snapshot(test_id)
+    delete_snapshot(test_id)
+
+    assert not os.path.exists(os.path.join(snapshot_dir, test_id))
+    assert fake_redis.get(index_snapshot.REDIS_GENERATION_PREFIX + test_id) == "1"
+    assert open_snapshot(test_id) is None
+
+
+@pytest.mark.parametrize("bad_id", ["/tmp/evil", "../escape", "not-a-uuid"])
+def test_only_uuid_test_ids_touch_the_disk(snapshot_dir, monkeypatch, bad_id):
+    stored_pages(monkeypatch, rows("c0"))
+    build_snapshot(bad_id)
+    record_ingestion(bad_id, *rows("c1"))
+    delete_snapshot(bad_id)
+
+    assert open_snapshot(bad_id) is None
+    assert os.listdir(snapshot_dir) == []
+    assert not os.path.exists("/tmp/evil.lock")
@@ -0,0 +1,176 @@
+import time
+import asyncio
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import utils.llm_client as llm_client
+from utils.llm_client import CircuitBreaker, LLMUnavailableError, LatencyTracker, generate_content
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    monkeypatch.setattr(llm_client, "breaker", CircuitBreaker(failure_threshold=2, reset_seconds=0.05))
+    monkeypatch.setattr(llm_client, "latency_tracker", LatencyTracker())
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE_SECONDS", 0.0)
+    monkeypatch.setattr(llm_client, "LLM_HEDGING_ENABLED", False)
+
+
+def unavailable():
+    return google_exceptions.ServiceUnavailable("overloaded")
+
+
+def open_breaker():
+    breaker = llm_client.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(breaker.reset_seconds)
+
+
+# --- Retries ---
+
+def test_answer_passes_through(scripted_genai):
+    genai = scripted_genai()
+    response = asyncio.run(generate_content("hello", timeout=2))
+    assert response.text
+    assert genai.calls == 1
+    assert llm_client.breaker.state == "closed"
+
+
+def test_retryable_error_is_retried(scripted_genai):
+    genai = scripted_genai(unavailable(), unavailable())
+    response = asyncio.run(generate_content("hello", timeout=2))
+    assert response.text
+    assert genai.calls == 3
+    assert llm_client.breaker.failures == 0
+
+
+def test_non_retryable_error_is_raised_at_once(scripted_genai):
+    genai = scripted_genai(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        asyncio.run(generate_content("hello", timeout=2))
+    assert genai.calls == 1
+    assert llm_client.breaker.state == "closed"
+
+
+def test_exhausted_retries_raise_unavailable(scripted_genai):
+    genai = scripted_genai(unavailable(), unavailable(), unavailable())
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(generate_content("hello", timeout=2))
+    assert genai.calls == 3
+    assert llm_client.breaker.failures == 1
+
+
+# --- Circuit breaker ---
+
+def test_breaker_opens_and_fails_fast(scripted_genai):
+    genai = scripted_genai(*[unavailable()] * 6)
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            asyncio.run(generate_content("hello", timeout=2))
+    assert llm_client.breaker.state == "open"
+
+    calls = genai.calls
+    with pytest.raises(LLMUnavailableError, match="circuit breaker is open"):
+        asyncio.run(generate_content("hello", timeout=2))
+    assert genai.calls == calls
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = llm_client.breaker
+    open_breaker()
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_the_breaker(scripted_genai):
+    scripted_genai()
+    open_breaker()
+    asyncio.run(generate_content("hello", timeout=2))
+    assert llm_client.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker(scripted_genai):
+    scripted_genai(unavailable(), unavailable(), unavailable())
+    open_breaker()
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(generate_content("hello", timeout=2))
+    assert llm_client.breaker.state == "open"
+
+
+def test_non_retryable_probe_does_not_wedge_the_breaker(scripted_genai):
+    genai = scripted_genai(ValueError("bad request"))
+    open_breaker()
+    with pytest.raises(ValueError):
+        asyncio.run(generate_content("hello", timeout=2))
+
+    # The provider answered, so the breaker closes and later calls go through
+    assert llm_client.breaker.state == "closed"
+    asyncio.run(generate_content("hello", timeout=2))
+    assert genai.calls == 2
+
+
+def test_cancelled_probe_releases_the_slot(scripted_genai):
+    scripted_genai(0.5)
+    open_breaker()
+
+    async def cancel_probe():
+        task = asyncio.create_task(generate_content("hello", timeout=2))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert llm_client.breaker.state == "half_open"
+    assert llm_client.breaker.allow()
+
+
+# --- Deadlines and hedging ---
+
+def test_call_timeout_is_enforced(scripted_genai):
+    scripted_genai(1.0, 1.0, 1.0)
+    started = time.monotonic()
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(generate_content("hello", timeout=0.2))
+    assert time.monotonic() - started < 0.6
+
+
+def test_request_deadline_caps_every_call(scripted_genai):
+    scripted_genai(1.0, 1.0, 1.0)
+
+    async def within_request():
+        token = llm_client.start_request_deadline(0.2)
+        try:
+            return await generate_content("hello", timeout=5)
+        finally:
+            llm_client.reset_request_deadline(token)
+
+    started = time.monotonic()
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(within_request())
+    assert time.monotonic() - started < 0.6
+
+
+def test_slow_call_is_hedged(scripted_genai, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGING_ENABLED", True)
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    genai = scripted_genai(1.0)
+
+    started = time.monotonic()
+    response = asyncio.run(generate_content("hello", timeout=2))
+    assert response.text
+    assert genai.calls == 2
+    assert time.monotonic() - started < 0.5
+
+
+def test_hedge_delay_follows_recent_latency(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_PERCENTILE", 95)
+    tracker = LatencyTracker(window=100, min_samples=20)
+    assert tracker.hedge_delay() == llm_client.LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    for i in range(100):
+        tracker.record(i / 100)
+    assert tracker.hedge_delay() == pytest.approx(0.95)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from utils.quantized_index import QuantizedIndex, dequantize_embeddings, quantize_embeddings
+
+DIM = 64
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(7)
+    embeddings = rng.standard_normal((2000, DIM)).astype(np.float32)
+    queries = rng.standard_normal((25, DIM)).astype(np.float32)
+    return [f"id-{i}" for i in range(len(embeddings))], embeddings, queries
+
+
+def exact_top_k(embeddings, query, top_k):
+    distances = ((embeddings - query) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:top_k]
+    return [int(i) for i in order], distances[order]
+
+
+@pytest.mark.parametrize("storage_dtype", ["float32", "float16", "int8"])
+def test_rescored_top_k_matches_exact_search(corpus, storage_dtype):
+    ids, embeddings, queries = corpus
+    index = QuantizedIndex(ids, embeddings, storage_dtype, rescore_source=embeddings)
+    for query in queries:
+        expected_rows, expected_distances = exact_top_k(embeddings, query, 10)
+        rows, distances = index.search_rows(query, 10)
+        assert rows == expected_rows
+        np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+
+
+def test_search_returns_ids(corpus):
+    ids, embeddings, _ = corpus
+    index = QuantizedIndex(ids, embeddings, "int8", rescore_source=embeddings)
+    found, distances = index.search(embeddings[42], 1)
+    assert found == ["id-42"]
+    assert distances[0] == pytest.approx(0.0, abs=1e-4)
+
+
+def test_int8_scales_round_trip_within_tolerance(corpus):
+    _, embeddings, _ = corpus
+    codes, scales = quantize_embeddings(embeddings, "int8")
+    assert codes.dtype == np.int8 and scales.shape == (len(embeddings),)
+
+    restored = dequantize_embeddings(codes, scales)
+    # Symmetric rounding: every component is off by at most half a quantization step
+    error = np.abs(restored - embeddings).max(axis=1)
+    assert np.all(error <= scales / 2 + 1e-6)
+    # And the per-vector scale maps each vector's largest component onto 127
+    np.testing.assert_allclose(scales * 127, np.abs(embeddings).max(axis=1), rtol=1e-6)
+
+
+def test_all_zero_vectors_quantize(corpus):
+    codes, scales = quantize_embeddings(np.zeros((2, DIM), dtype=np.float32), "int8")
+    assert not np.any(codes)
+    assert np.all(dequantize_embeddings(codes, scales) == 0)
+
+
+def test_compact_storage_shrinks_resident_memory(corpus):
+    ids, embeddings, _ = corpus
+    sizes = {dtype: QuantizedIndex(ids, embeddings, dtype, rescore_source=embeddings).nbytes for dtype in ("float32", "float16", "int8")}
+    assert sizes["float16"] < 0.55 * sizes["float32"]
+    assert sizes["int8"] < 0.3 * sizes["float32"]
+
+
+def test_dimension_mismatch_is_rejected(corpus):
+    ids, embeddings, _ = corpus
+    with pytest.raises(ValueError):
+        QuantizedIndex(ids, embeddings, "int8").search_rows(np.zeros(DIM + 1), 3)
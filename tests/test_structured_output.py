@@ -0,0 +1,94 @@
+import json
+from typing import List
+
+import pytest
+
+from benchmarks.stubs import GRADING_ANSWER
+from models.GradingAnswer import GradingAnswer
+from models.QuestionGenerationResponse import QuestionItem
+from models.RetrieveResponse import RetrieveResponse
+from utils.metrics import STRUCTURED_OUTPUT
+from utils.structured_output import StructuredOutputError, parse_structured, repair_json
+
+GRADE = json.dumps(GRADING_ANSWER)
+QUESTIONS = json.dumps([{"question_no": i, "content": f'Question {i}, with "quotes" and ] brackets?'} for i in (1, 2, 3)])
+# Cut inside the last item's keys: only dropping that item gives a valid list
+TRUNCATED_QUESTIONS = QUESTIONS[:QUESTIONS.rindex('"content"') + 4]
+
+
+def outcome_count(schema: str, outcome: str) -> float:
+    return STRUCTURED_OUTPUT.labels(schema=schema, outcome=outcome)._value.get()
+
+
+# --- repair_json ---
+
+def test_fences_and_prose_are_stripped():
+    fenced = f"Here is the grade:\n```json\n{GRADE}\n```\nLet me know if you need more."
+    assert json.loads(repair_json(fenced)[0]) == GRADING_ANSWER
+
+
+def test_text_after_the_payload_is_dropped():
+    assert repair_json('{"a": [1, 2]} trailing {"b": 3}') == ['{"a": [1, 2]}']
+
+
+def test_trailing_commas_are_dropped():
+    assert json.loads(repair_json('{"a": [1, 2, ], "b": {"c": 1,},\n}')[0]) == {"a": [1, 2], "b": {"c": 1}}
+
+
+def test_commas_and_brackets_inside_strings_are_kept():
+    text = '{"a": "x, ]", "b": "say \\"hi,\\" }",}'
+    assert json.loads(repair_json(text)[0]) == {"a": "x, ]", "b": 'say "hi," }'}
+
+
+def test_truncated_output_yields_closing_candidates():
+    candidates = repair_json(TRUNCATED_QUESTIONS)
+    parsed = [json.loads(c) for c in candidates if _is_json(c)]
+    # Cut back to the last complete element: the first two questions survive intact
+    assert json.loads(QUESTIONS)[:2] in parsed
+
+
+def test_truncated_inside_a_string_is_closed():
+    assert json.loads(repair_json('{"rationale": "cut off mid')[0]) == {"rationale": "cut off mid"}
+
+
+def _is_json(text: str) -> bool:
+    try:
+        json.loads(text)
+        return True
+    except ValueError:
+        return False
+
+
+# --- parse_structured ---
+
+def test_valid_output_takes_the_fast_path():
+    before = outcome_count("test_grading", "fast")
+    grade = parse_structured(GRADE, GradingAnswer, "test_grading")
+    assert grade.pass_ is True
+    assert grade.breakdown[0].criterion == "accuracy"
+    assert outcome_count("test_grading", "fast") == before + 1
+
+
+def test_malformed_output_is_repaired():
+    before = outcome_count("test_questions", "repaired")
+    questions = parse_structured(f"```json\n{TRUNCATED_QUESTIONS}", List[QuestionItem], "test_questions")
+    assert [q.question_no for q in questions] == [1, 2]
+    assert outcome_count("test_questions", "repaired") == before + 1
+
+
+def test_unrepairable_output_raises():
+    before = outcome_count("test_grading", "failed")
+    with pytest.raises(StructuredOutputError):
+        parse_structured("I cannot grade this answer.", GradingAnswer, "test_grading")
+    with pytest.raises(StructuredOutputError):
+        parse_structured('{"overall_score": "high"}', GradingAnswer, "test_grading")
+    assert outcome_count("test_grading", "failed") == before + 2
+
+
+def test_pass_alias_round_trips_through_the_response():
+    grade = parse_structured(GRADE, GradingAnswer, "test_grading")
+    body = json.loads(RetrieveResponse(results=[], answer=grade).model_dump_json(by_alias=True))
+    assert body["answer"]["pass"] is True
+    assert "pass_" not in body["answer"]
+    assert GradingAnswer.model_validate(body["answer"]) == grade
+    assert GradingAnswer(overall_score=1, breakdown=[], pass_=False).model_dump(by_alias=True)["pass"] is False
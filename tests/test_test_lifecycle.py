@@ -0,0 +1,117 @@
+import uuid
+import random
+
+import pytest
+
+import utils.test_lifecycle as test_lifecycle
+from utils.process_text_pipeline import process_text_pipeline
+from utils.vector_store import get_write_collection, iter_sources, partition_name, pending_retirements, resolve_collection
+
+
+@pytest.fixture(autouse=True)
+def no_throttle(monkeypatch):
+    monkeypatch.setattr(test_lifecycle, "REINDEX_MAX_CHUNKS_PER_SECOND", 0)
+    monkeypatch.setattr(test_lifecycle, "VERSION_RETIRE_DELAY_SECONDS", 0)
+
+
+@pytest.fixture
+def test_id():
+    return str(uuid.uuid4())
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("abcdefgh \n") for _ in range(length))
+
+
+def reindex(test_id: str, chunk_size: int = 500, chunk_overlap: int = 100) -> dict:
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "type": "reindex",
+        "test_id": test_id,
+        "status": "running",
+        "params": {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "embedding_model": None},
+        "processed_sources": 0,
+        "processed_chunks": 0,
+    }
+    return test_lifecycle._reindex_work(job)
+
+
+def texts_of(collection):
+    return sorted(text for _, text, _ in iter_sources(collection))
+
+
+def test_reindex_swaps_in_the_new_settings(chroma, fake_redis, test_id):
+    rng = random.Random(1)
+    texts = [random_text(rng, n) for n in (900, 2600)]
+    for text in texts:
+        process_text_pipeline(text, {"test_id": test_id})
+
+    result = reindex(test_id)
+    live = resolve_collection(test_id)[0]
+    assert live.name == result["version"]
+    assert live.metadata["chunk_size"] == 500
+    assert texts_of(live) == sorted(texts)
+    assert pending_retirements(test_id) == [partition_name(test_id)]
+
+
+def test_late_writes_to_the_old_version_are_drained(chroma, fake_redis, test_id):
+    rng = random.Random(2)
+    original = random_text(rng, 1800)
+    process_text_pipeline(original, {"test_id": test_id})
+    old = get_write_collection(test_id)
+
+    reindex(test_id)
+    # A worker that resolved its route before the swap finishes its ingestion into the old version
+    late = random_text(rng, 1300)
+    process_text_pipeline(late, {"test_id": test_id}, collection=old)
+
+    assert test_lifecycle.retire_due_versions() == 1
+    live = resolve_collection(test_id)[0]
+    assert texts_of(live) == sorted([original, late])
+    assert old.count() == 0
+    assert pending_retirements(test_id) == []
+    assert fake_redis.zcard(test_lifecycle.REDIS_RETIRE_QUEUE) == 0
+
+
+def test_retirement_waits_for_running_jobs(chroma, fake_redis, test_id):
+    process_text_pipeline(random_text(random.Random(3), 1500), {"test_id": test_id})
+    reindex(test_id)
+
+    assert test_lifecycle._acquire(test_id, "running-job")
+    try:
+        assert test_lifecycle.retire_due_versions() == 0
+        assert fake_redis.zcard(test_lifecycle.REDIS_RETIRE_QUEUE) == 1
+    finally:
+        test_lifecycle._release(test_id, "running-job")
+
+    assert test_lifecycle.retire_due_versions() == 1
+
+
+def test_queued_retirement_of_a_deleted_test_is_dropped(chroma, fake_redis, test_id):
+    process_text_pipeline(random_text(random.Random(4), 1500), {"test_id": test_id})
+    reindex(test_id)
+    test_lifecycle._delete_work({"test_id": test_id})
+
+    assert test_lifecycle.retire_due_versions() == 1
+    assert fake_redis.zcard(test_lifecycle.REDIS_RETIRE_QUEUE) == 0
+
+
+def test_versions_lost_by_a_restart_are_retired_on_demand(chroma, monkeypatch, test_id):
+    # No Redis and the timer died with the process: the base partition still lists the version
+    process_text_pipeline(random_text(random.Random(5), 1500), {"test_id": test_id})
+    monkeypatch.setattr(test_lifecycle, "schedule_retirement", lambda *args, **kwargs: None)
+    reindex(test_id)
+    assert pending_retirements(test_id) == [partition_name(test_id)]
+
+    assert test_lifecycle.retire_pending(test_id) == 1
+    assert pending_retirements(test_id) == []
+
+
+def test_unknown_embedding_model_is_rejected():
+    from pydantic import ValidationError
+    from models.ReindexRequest import ReindexRequest
+
+    assert ReindexRequest(embedding_model="models/text-embedding-004").embedding_model == "models/text-embedding-004"
+    assert ReindexRequest().embedding_model is None
+    with pytest.raises(ValidationError, match="embedding_model"):
+        ReindexRequest(embedding_model="models/does-not-exist")
@@ -0,0 +1,172 @@
+import uuid
+import random
+
+import pytest
+
+import utils.rag_initialization as rag_state
+import utils.vector_store as vector_store
+from utils.process_text_pipeline import process_text_pipeline
+from utils.vector_store import (
+    activate_version, create_version, delete_test, get_write_collection, iter_sources,
+    list_source_ids, migrate_test, partition_name, pending_retirements, resolve_collection, retire_version,
+)
+
+
+@pytest.fixture
+def test_id():
+    return str(uuid.uuid4())
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("abcdefgh \n") for _ in range(length))
+
+
+def legacy_chunks(text: str):
+    """The fixed 1000/200 sliding window every chunk was cut with before sources were tracked"""
+    return [text[i:i + 1000] for i in range(0, len(text), 800) if len(text[i:i + 1000]) > 50]
+
+
+def add_legacy(collection, texts, rng: random.Random, metadata: dict):
+    chunks = [chunk for text in texts for chunk in legacy_chunks(text)]
+    rng.shuffle(chunks)
+    collection.add(
+        ids=[str(uuid.uuid4()) for _ in chunks],
+        documents=chunks,
+        embeddings=[rag_state.embedding_model.encode(chunk) for chunk in chunks],
+        metadatas=[dict(metadata) for _ in chunks],
+    )
+
+
+# --- iter_sources ---
+
+def test_tracked_sources_are_stitched_exactly(chroma, test_id):
+    rng = random.Random(1)
+    collection = get_write_collection(test_id)
+    texts = [random_text(rng, n) for n in (60, 999, 1000, 1801, 5000)]
+    for text in texts:
+        process_text_pipeline(text, {"test_id": test_id, "kind": "doc"}, collection=collection)
+
+    sources = list(iter_sources(collection, page_size=7))
+    assert sorted(text for _, text, _ in sources) == sorted(texts)
+    for source_id, _, metadata in sources:
+        assert metadata["source_id"] == source_id
+        assert metadata["kind"] == "doc"
+        assert "chunk_index" not in metadata
+
+
+def test_untracked_chunks_are_stitched_back_into_documents(chroma, test_id):
+    rng = random.Random(2)
+    collection = get_write_collection(test_id)
+    # Same metadata for every document, shuffled insertion: only the overlaps tell them apart
+    texts = [random_text(rng, n) for n in (999, 1000, 1801, 3456, 851)]
+    add_legacy(collection, texts, rng, {"test_id": test_id})
+
+    sources = list(iter_sources(collection, page_size=4))
+    assert sorted(text for _, text, _ in sources) == sorted(texts)
+    assert {source_id for source_id, _, _ in sources} <= set(collection.get(include=[])["ids"])
+
+
+def test_sources_in_skip_are_not_yielded(chroma, test_id):
+    rng = random.Random(3)
+    collection = get_write_collection(test_id)
+    process_text_pipeline(random_text(rng, 2000), {"test_id": test_id}, collection=collection)
+    add_legacy(collection, [random_text(rng, 2000)], rng, {"test_id": test_id})
+
+    present = list_source_ids(collection)
+    assert list(iter_sources(collection, skip=present)) == []
+
+
+def test_client_source_id_is_replaced(chroma, test_id):
+    rng = random.Random(5)
+    collection = get_write_collection(test_id)
+    texts = [random_text(rng, 1500), random_text(rng, 1700)]
+    for text in texts:
+        process_text_pipeline(text, {"test_id": test_id, "source_id": "client-id"}, collection=collection)
+
+    sources = list(iter_sources(collection))
+    assert sorted(text for _, text, _ in sources) == sorted(texts)
+    assert "client-id" not in {source_id for source_id, _, _ in sources}
+
+
+def test_nothing_to_store_returns_zero(chroma, test_id):
+    collection = get_write_collection(test_id)
+    assert process_text_pipeline("   ", {"test_id": test_id}, collection=collection) == 0
+    assert process_text_pipeline("too short", {"test_id": test_id}, collection=collection) == 0
+
+
+# --- Routing ---
+
+def test_version_swap_reaches_workers_with_a_cached_route(chroma, fake_redis, monkeypatch, test_id):
+    base = get_write_collection(test_id)
+    assert resolve_collection(test_id)[0].name == base.name
+
+    # Another worker swaps the version: this process' cache is left untouched
+    monkeypatch.setattr(vector_store, "invalidate_route", lambda test_id: None)
+    target = create_version(test_id, 500, 100, None)
+    activate_version(test_id, target)
+
+    assert resolve_collection(test_id)[0].name == target.name
+    assert get_write_collection(test_id).name == target.name
+
+
+def test_delete_reaches_workers_with_a_cached_route(chroma, fake_redis, monkeypatch, test_id):
+    rng = random.Random(4)
+    process_text_pipeline(random_text(rng, 1500), {"test_id": test_id}, collection=get_write_collection(test_id))
+    assert resolve_collection(test_id)[1] is None
+
+    monkeypatch.setattr(vector_store, "invalidate_route", lambda test_id: None)
+    delete_test(test_id)
+
+    collection, where = resolve_collection(test_id)
+    assert collection.name == rag_state.collection.name
+    assert where == {"test_id": test_id}
+
+
+def test_failed_migration_drops_the_partial_partition(chroma, monkeypatch, test_id):
+    rng = random.Random(6)
+    add_legacy(rag_state.collection, [random_text(rng, 3000)], rng, {"test_id": test_id})
+    shared_ids = rag_state.collection.get(where={"test_id": test_id}, include=[])["ids"]
+
+    real_pages = vector_store.iter_test_pages
+
+    def failing_pages(*args, **kwargs):
+        pages = real_pages(*args, **kwargs)
+        yield next(pages)
+        raise ConnectionError("Chroma went away")
+    monkeypatch.setattr(vector_store, "iter_test_pages", failing_pages)
+
+    with pytest.raises(ConnectionError):
+        migrate_test(test_id, page_size=2)
+    assert vector_store.get_collection_or_none(partition_name(test_id)) is None
+    assert sorted(rag_state.collection.get(where={"test_id": test_id}, include=[])["ids"]) == sorted(shared_ids)
+    assert resolve_collection(test_id)[1] == {"test_id": test_id}
+
+    # A rerun starts from scratch and completes
+    monkeypatch.setattr(vector_store, "iter_test_pages", real_pages)
+    assert migrate_test(test_id, page_size=2).count() == len(shared_ids)
+
+
+# --- Versions ---
+
+def test_crashed_build_is_kept_for_retirement(chroma, test_id):
+    get_write_collection(test_id)
+    crashed = create_version(test_id, 500, 100, None)
+    retry = create_version(test_id, 500, 100, None)
+
+    assert crashed.name != retry.name
+    assert pending_retirements(test_id) == [crashed.name]
+    retire_version(test_id, crashed.name)
+    assert pending_retirements(test_id) == []
+    assert vector_store.get_collection_or_none(crashed.name) is None
+
+
+def test_live_version_is_never_retired(chroma, test_id):
+    base = get_write_collection(test_id)
+    with pytest.raises(ValueError):
+        retire_version(test_id, base.name)
+
+    target = create_version(test_id, 500, 100, None)
+    activate_version(test_id, target)
+    with pytest.raises(ValueError):
+        retire_version(test_id, target.name)
+    assert pending_retirements(test_id) == [partition_name(test_id)]
@@ -0,0 +1,192 @@
+import os
+import asyncio
+import hashlib
+from typing import List, Optional
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from loguru import logger
+import utils.redis_init as redis_state
+from utils.metrics import record_cache
+from utils.test_ai_content import zero_gpt_test
+
+load_dotenv()
+
+# Scores are a pure function of the text, so they can be cached for a long time
+AI_SCORE_CACHE_TTL = int(os.getenv("AI_SCORE_CACHE_TTL", "864000"))       # 10 days, same as query expansion
+AI_SCORE_LOCAL_CACHE_SIZE = int(os.getenv("AI_SCORE_LOCAL_CACHE_SIZE", "5000"))
+AI_DETECTION_CONCURRENCY = int(os.getenv("AI_DETECTION_CONCURRENCY", "8"))  # max parallel ZeroGPT calls per process
+AI_SCORE_PENDING_TTL = int(os.getenv("AI_SCORE_PENDING_TTL", "120"))  # how long a deferred computation is reported as "pending"
+AI_SCORE_FAILED_TTL = int(os.getenv("AI_SCORE_FAILED_TTL", "60"))     # how long a failed one is reported as "failed"
+
+REDIS_SCORE_PREFIX = "ai_score:"
+REDIS_PENDING_PREFIX = "ai_score_pending:"
+REDIS_FAILED_PREFIX = "ai_score_failed:"
+
+_local_cache = TTLCache(maxsize=AI_SCORE_LOCAL_CACHE_SIZE, ttl=AI_SCORE_CACHE_TTL)
+_local_failures = TTLCache(maxsize=AI_SCORE_LOCAL_CACHE_SIZE, ttl=AI_SCORE_FAILED_TTL)
+_in_flight = {}           # content hash -> asyncio.Task, so concurrent retries share one ZeroGPT call
+_background_tasks = set() # strong refs for deferred computations
+_semaphore = None
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(AI_DETECTION_CONCURRENCY)
+    return _semaphore
+
+
+def _lookup_cached(digest: str) -> Optional[float]:
+    """Local LRU first, then Redis (shared by all workers/pods)"""
+    score = _local_cache.get(digest)
+    record_cache("ai_score_local", score is not None)
+    if score is not None:
+        return score
+
+    if redis_state.redis_client is None:
+        return None
+    try:
+        cached = redis_state.redis_client.get(REDIS_SCORE_PREFIX + digest)
+    except Exception as e:
+        logger.warning(f"Redis lookup for AI score failed: {e}")
+        return None
+    record_cache("ai_score_redis", cached is not None)
+    if cached is None:
+        return None
+
+    score = float(cached)
+    _local_cache[digest] = score
+    return score
+
+
+def _store(digest: str, score: float):
+    # Failures (-1) are not cached so the next request retries ZeroGPT; they only leave a
+    # short-lived marker so a deferred caller polling /ai-score sees "failed" instead of "not_found"
+    succeeded = score is not None and score >= 0
+    if succeeded:
+        _local_cache[digest] = score
+        _local_failures.pop(digest, None)
+    else:
+        _local_failures[digest] = True
+    if redis_state.redis_client is None:
+        return
+    try:
+        pipe = redis_state.redis_client.pipeline()
+        if succeeded:
+            pipe.set(REDIS_SCORE_PREFIX + digest, score, ex=AI_SCORE_CACHE_TTL)
+            pipe.delete(REDIS_FAILED_PREFIX + digest)
+        else:
+            pipe.set(REDIS_FAILED_PREFIX + digest, 1, ex=AI_SCORE_FAILED_TTL)
+        pipe.delete(REDIS_PENDING_PREFIX + digest)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis store for AI score failed: {e}")
+
+
+async def _compute(digest: str, text: str) -> float:
+    async with _get_semaphore():
+        score = await zero_gpt_test(text)
+    _store(digest, score)
+    return score
+
+
+def _single_flight(digest: str, text: str) -> asyncio.Task:
+    task = _in_flight.get(digest)
+    if task is None:
+        task = asyncio.create_task(_compute(digest, text))
+        _in_flight[digest] = task
+        task.add_done_callback(lambda _: _in_flight.pop(digest, None))
+    return task
+
+
+async def get_ai_score(text: str) -> float:
+    """Cached, de-duplicated ZeroGPT score for one answer (-1 on failure, like zero_gpt_test)"""
+    digest = content_hash(text)
+    score = _lookup_cached(digest)
+    if score is not None:
+        return score
+    # shield: a cancelled caller must not cancel the call other waiters share
+    return await asyncio.shield(_single_flight(digest, text))
+
+
+async def get_ai_scores(texts: List[str]) -> List[float]:
+    """
+    Bulk variant for batch grading: duplicates are scored once, all Redis misses are
+    fetched in a single MGET round-trip and the remaining ZeroGPT calls run concurrently.
+    """
+    digests = [content_hash(t) for t in texts]
+    unique = dict(zip(digests, texts))
+    scores = {}
+
+    for digest in unique:
+        score = _local_cache.get(digest)
+        record_cache("ai_score_local", score is not None)
+        if score is not None:
+            scores[digest] = score
+
+    remote = [d for d in unique if d not in scores]
+    if remote and redis_state.redis_client is not None:
+        try:
+            cached = redis_state.redis_client.mget([REDIS_SCORE_PREFIX + d for d in remote])
+        except Exception as e:
+            logger.warning(f"Redis MGET for AI scores failed: {e}")
+            cached = [None] * len(remote)
+        for digest, value in zip(remote, cached):
+            record_cache("ai_score_redis", value is not None)
+            if value is not None:
+                scores[digest] = _local_cache[digest] = float(value)
+
+    missing = [d for d in unique if d not in scores]
+    if missing:
+        logger.info(f"Scoring {len(missing)} unique answers with ZeroGPT ({len(texts)} requested)")
+        results = await asyncio.gather(*(asyncio.shield(_single_flight(d, unique[d])) for d in missing))
+        scores.update(zip(missing, results))
+
+    return [scores[d] for d in digests]
+
+
+def schedule_ai_score(text: str) -> str:
+    """
+    Deferred mode: returns the content hash immediately and computes the score in the
+    background. The result is fetched later with lookup_ai_score (GET /ai-score/{hash}).
+    """
+    digest = content_hash(text)
+    if _lookup_cached(digest) is not None or digest in _in_flight:
+        return digest
+
+    if redis_state.redis_client is not None:
+        try:
+            redis_state.redis_client.set(REDIS_PENDING_PREFIX + digest, 1, ex=AI_SCORE_PENDING_TTL)
+        except Exception as e:
+            logger.warning(f"Redis pending marker for AI score failed: {e}")
+
+    task = _single_flight(digest, text)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return digest
+
+
+def lookup_ai_score(digest: str):
+    """Returns (status, score) with status in ready / pending / failed / not_found"""
+    score = _lookup_cached(digest)
+    if score is not None:
+        return "ready", score
+
+    if digest in _in_flight:
+        return "pending", None
+    if redis_state.redis_client is not None:
+        try:
+            pending, failed = redis_state.redis_client.mget([REDIS_PENDING_PREFIX + digest, REDIS_FAILED_PREFIX + digest])
+            if pending is not None:
+                return "pending", None
+            if failed is not None:
+                return "failed", None
+        except Exception as e:
+            logger.warning(f"Redis pending lookup for AI score failed: {e}")
+    if digest in _local_failures:
+        return "failed", None
+    return "not_found", None
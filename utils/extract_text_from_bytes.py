@@ -1,5 +1,3 @@
-from pypdf import PdfReader
-import docx
 import io
 
 def extract_text_from_bytes(content: bytes, file_ext: str) -> str:
@@ -7,8 +5,10 @@ def extract_text_from_bytes(content: bytes, file_ext: str) -> str:
     text_content = ""
     file_stream = io.BytesIO(content)
 
+    # pypdf / python-docx are imported on first use to keep worker startup fast
     if 'pdf' in file_ext:
         try:
+            from pypdf import PdfReader
             reader = PdfReader(file_stream)
             for page in reader.pages:
                 text_content += page.extract_text() + "\n"
@@ -17,6 +17,7 @@ def extract_text_from_bytes(content: bytes, file_ext: str) -> str:
             
     elif 'doc' in file_ext:
         try:
+            import docx
             doc = docx.Document(file_stream)
             for para in doc.paragraphs:
                 text_content += para.text + "\n"
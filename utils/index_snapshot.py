@@ -0,0 +1,421 @@
+import os
+import json
+import uuid
+import mmap
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager, suppress
+import numpy as np
+from cachetools import LRUCache
+from dotenv import load_dotenv
+from loguru import logger
+import utils.redis_init as redis_state
+from utils.quantized_index import QuantizedIndex, VECTOR_STORAGE_DTYPE
+from utils.metrics import record_cache
+from utils.vector_store import iter_test_pages, resolve_collection
+
+load_dotenv()
+
+# --- On-disk Index Snapshots ---
+# One directory per test_id under INDEX_SNAPSHOT_DIR (disabled when unset):
+#   vectors.f32                        contiguous (count, dim) float32 matrix
+#   ids.bin / ids.offsets              utf-8 ids, int64 end offset per row
+#   documents.bin / documents.offsets  chunk texts, same layout
+#   metadatas.bin / metadatas.offsets  JSON metadata, same layout
+#   manifest.json                      {"format", "dim", "count", "generation", "collection"} - written last, atomically
+# Files are opened with numpy.memmap / mmap, so every worker process on the pod shares them
+# through the OS page cache. Readers only trust the first manifest["count"] rows, which makes
+# appends crash-safe: a torn append is simply truncated away by the next writer.
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR")
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", "64"))  # open snapshots kept per process
+SNAPSHOT_FORMAT = 1
+
+BLOB_FIELDS = ("ids", "documents", "metadatas")
+REDIS_GENERATION_PREFIX = "snapshot_gen:"
+
+_open_snapshots = LRUCache(maxsize=SNAPSHOT_CACHE_SIZE)
+_open_lock = threading.Lock()
+_hydrating = set()
+_hydrating_lock = threading.Lock()
+
+
+def snapshots_enabled() -> bool:
+    return bool(INDEX_SNAPSHOT_DIR)
+
+
+def _snapshot_key(test_id: str):
+    """The test_id if it is a canonical UUID, else None: nothing else is ever joined into a snapshot path"""
+    test_id = str(test_id)
+    try:
+        return test_id if str(uuid.UUID(test_id)) == test_id else None
+    except ValueError:
+        return None
+
+
+def _snapshot_path(test_id: str) -> str:
+    return os.path.join(INDEX_SNAPSHOT_DIR, test_id)
+
+
+def _stale_marker(test_id: str) -> str:
+    """Exists while a snapshot misses rows an ingestion could not append (the lock was busy)"""
+    return os.path.join(INDEX_SNAPSHOT_DIR, f"{test_id}.stale")
+
+
+@contextmanager
+def _test_lock(test_id: str, blocking: bool = True):
+    """Cross-process lock per test (ingestion appends vs. hydration). Yields False if not acquired."""
+    os.makedirs(INDEX_SNAPSHOT_DIR, exist_ok=True)
+    with open(os.path.join(INDEX_SNAPSHOT_DIR, f"{test_id}.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_manifest(path: str):
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(path: str, manifest: dict):
+    tmp = os.path.join(path, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, "manifest.json"))
+
+
+def current_generation(test_id: str):
+    """Ingestion generation shared by all pods through Redis (None without Redis: trust the local snapshot)"""
+    if redis_state.redis_client is None:
+        return None
+    try:
+        value = redis_state.redis_client.get(REDIS_GENERATION_PREFIX + str(test_id))
+    except Exception as e:
+        logger.warning(f"Redis lookup of snapshot generation failed: {e}")
+        return None
+    return int(value) if value is not None else 0
+
+
+class _BlobTable:
+    """Read-only view over a blob file + int64 end-offsets file; rows are decoded on access only"""
+
+    def __init__(self, path: str, field: str, count: int, as_json: bool = False):
+        self.count = count
+        self.as_json = as_json
+        self.offsets = np.memmap(os.path.join(path, f"{field}.offsets"), dtype="<i8", mode="r", shape=(count,)) if count else np.zeros(0, "<i8")
+        blob_path = os.path.join(path, f"{field}.bin")
+        self._file = open(blob_path, "rb")
+        size = int(self.offsets[-1]) if count else 0
+        self.blob = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i: int):
+        start = int(self.offsets[i - 1]) if i > 0 else 0
+        raw = self.blob[start:int(self.offsets[i])].decode("utf-8")
+        return json.loads(raw) if self.as_json else raw
+
+
+class SnapshotIndex:
+    """A memory-mapped per-test snapshot, searchable with the same result shape as collection.query"""
+
+    def __init__(self, test_id: str, path: str, manifest: dict):
+        self.test_id = test_id
+        self.path = path
+        self.generation = manifest.get("generation", 0)
+        self.count = manifest["count"]
+        self.dim = manifest["dim"]
+        self.manifest_mtime = os.stat(os.path.join(path, "manifest.json")).st_mtime_ns
+
+        self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        self.ids = _BlobTable(path, "ids", self.count)
+        self.documents = _BlobTable(path, "documents", self.count)
+        self.metadatas = _BlobTable(path, "metadatas", self.count, as_json=True)
+
+        # float32: search the memmap directly (shared page cache, ~0 private memory).
+        # float16/int8: private compact codes, exact rescoring against the memmap.
+        self.index = QuantizedIndex(self.ids, self.vectors, VECTOR_STORAGE_DTYPE, rescore_source=self.vectors)
+
+    def query(self, query_vector, n_results: int):
+        rows, distances = self.index.search_rows(query_vector, n_results)
+        return {
+            "ids": [[self.ids[r] for r in rows]],
+            "documents": [[self.documents[r] for r in rows]],
+            "metadatas": [[self.metadatas[r] for r in rows]],
+            "distances": [distances],
+        }
+
+
+def open_snapshot(test_id: str, collection_name: str = None):
+    """
+    Returns a fresh SnapshotIndex for test_id, or None if snapshots are disabled, missing
+    or stale (another pod ingested into the test since the snapshot was written, or it was
+    built from another collection than `collection_name`, e.g. before a re-index swap).
+    """
+    test_id = _snapshot_key(test_id) if snapshots_enabled() else None
+    if test_id is None:
+        return None
+
+    path = _snapshot_path(test_id)
+    manifest = _read_manifest(path)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT or not manifest.get("count"):
+        record_cache("index_snapshot", False)
+        return None
+    if collection_name is not None and manifest.get("collection") != collection_name:
+        record_cache("index_snapshot", False)
+        return None
+
+    generation = current_generation(test_id)
+    if generation is not None and manifest.get("generation", 0) != generation:
+        record_cache("index_snapshot", False)
+        return None
+    if os.path.exists(_stale_marker(test_id)):
+        record_cache("index_snapshot", False)
+        return None
+
+    try:
+        mtime = os.stat(os.path.join(path, "manifest.json")).st_mtime_ns
+    except OSError:
+        return None # swapped out by a concurrent rebuild
+    with _open_lock:
+        snapshot = _open_snapshots.get(test_id)
+    if snapshot is None or snapshot.manifest_mtime != mtime:
+        try:
+            snapshot = SnapshotIndex(test_id, path, manifest)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to open index snapshot for Test ID {test_id}: {e}")
+            return None
+        with _open_lock:
+            _open_snapshots[test_id] = snapshot
+
+    record_cache("index_snapshot", True)
+    return snapshot
+
+
+def _append_rows(path: str, manifest: dict, ids, embeddings, documents, metadatas):
+    """Appends rows after truncating any torn tail beyond manifest['count'], then publishes the manifest"""
+    count = manifest["count"]
+    dim = manifest["dim"]
+
+    vectors_path = os.path.join(path, "vectors.f32")
+    with open(vectors_path, "ab") as f:
+        f.truncate(count * dim * 4)
+        f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+
+    for field, values in zip(BLOB_FIELDS, (ids, documents, metadatas)):
+        offsets_path = os.path.join(path, f"{field}.offsets")
+        blob_path = os.path.join(path, f"{field}.bin")
+        end = 0
+        if count:
+            with open(offsets_path, "rb") as f:
+                f.seek((count - 1) * 8)
+                end = int(np.frombuffer(f.read(8), dtype="<i8")[0])
+
+        encoded = [
+            (json.dumps(v, ensure_ascii=False) if field == "metadatas" else str(v)).encode("utf-8")
+            for v in values
+        ]
+        new_offsets = end + np.cumsum([len(e) for e in encoded], dtype=np.int64)
+
+        with open(blob_path, "ab") as f:
+            f.truncate(end)
+            f.write(b"".join(encoded))
+        with open(offsets_path, "ab") as f:
+            f.truncate(count * 8)
+            f.write(new_offsets.astype("<i8").tobytes())
+
+    manifest = dict(manifest, count=count + len(ids))
+    _write_manifest(path, manifest)
+    return manifest
+
+
+def _snapshot_ids(path: str, count: int) -> set:
+    """ids of the first `count` rows of a snapshot"""
+    if not count:
+        return set()
+    ends = np.fromfile(os.path.join(path, "ids.offsets"), dtype="<i8", count=count).tolist()
+    with open(os.path.join(path, "ids.bin"), "rb") as f:
+        blob = f.read(ends[-1])
+    return {blob[start:end].decode("utf-8") for start, end in zip([0] + ends[:-1], ends)}
+
+
+def record_ingestion(test_id: str, ids, embeddings, documents, metadatas, collection_name: str = None):
+    """
+    Called by process_text_pipeline after the chunks were stored in Chroma (in `collection_name`).
+    Bumps the shared generation and appends to the local snapshot if it was up to date;
+    a snapshot that missed another pod's ingestion, or mirrors another collection, is left
+    stale and rebuilt on next read.
+    """
+    test_id = _snapshot_key(test_id) if snapshots_enabled() else None
+    if test_id is None or not ids:
+        return
+
+    new_generation = None
+    if redis_state.redis_client is not None:
+        try:
+            new_generation = int(redis_state.redis_client.incr(REDIS_GENERATION_PREFIX + test_id))
+        except Exception as e:
+            logger.warning(f"Redis generation bump failed, snapshot for Test ID {test_id} may be stale: {e}")
+
+    path = _snapshot_path(test_id)
+    # Never wait for the lock: a rebuild holds it while it pages the whole test out of Chroma
+    with _test_lock(test_id, blocking=False) as acquired:
+        if not acquired:
+            # The running rebuild may have paged Chroma before these rows landed: flag the snapshot
+            # so readers skip it until a rebuild that started after this point replaces it
+            open(_stale_marker(test_id), "w").close()
+            logger.info(f"Snapshot for Test ID {test_id} is busy, leaving it for rehydration")
+            return
+        manifest = _read_manifest(path)
+        if manifest is None:
+            # No snapshot yet: the first retrieval hydrates the whole test from Chroma
+            return
+        expected = manifest.get("generation", 0) + 1
+        if new_generation is not None and new_generation != expected:
+            logger.info(f"Snapshot for Test ID {test_id} missed an ingestion, leaving it for rehydration")
+            return
+        if collection_name is not None and manifest.get("collection") != collection_name:
+            # Written by a worker still routed to the previous index version
+            logger.info(f"Snapshot for Test ID {test_id} mirrors another collection, leaving it for rehydration")
+            return
+
+        manifest["generation"] = new_generation if new_generation is not None else expected
+
+        # A rebuild that paged Chroma after these rows were stored (but before the bump) already holds them
+        existing = _snapshot_ids(path, manifest["count"])
+        keep = [i for i, chunk_id in enumerate(ids) if str(chunk_id) not in existing]
+        if not keep:
+            _write_manifest(path, manifest)
+            return
+        if len(keep) < len(ids):
+            ids, embeddings, documents, metadatas = (
+                [values[i] for i in keep] for values in (ids, embeddings, documents, metadatas)
+            )
+        _append_rows(path, manifest, ids, embeddings, documents, metadatas)
+        logger.info(f"-> Appended {len(ids)} rows to index snapshot for Test ID: {test_id}")
+
+
+def build_snapshot(test_id: str):
+    """
+    (Re)builds a test's snapshot from Chroma, page by page, into a temp directory that is
+    swapped in atomically. Skips if another process is already building it.
+    """
+    test_id = _snapshot_key(test_id) if snapshots_enabled() else None
+    if test_id is None:
+        return
+
+    with _test_lock(test_id, blocking=False) as acquired:
+        if not acquired:
+            return
+
+        # Rows flagged before this point are paged below; a flag raised from now on outlives this build
+        with suppress(FileNotFoundError):
+            os.remove(_stale_marker(test_id))
+        generation = current_generation(test_id) or 0
+        # Pin the collection: it is recorded in the manifest, readers routed elsewhere ignore the snapshot
+        collection, where = resolve_collection(test_id)
+        path = _snapshot_path(test_id)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        manifest = None
+        for page in iter_test_pages(test_id, include=("embeddings", "documents", "metadatas"), collection=collection, where=where):
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if manifest is None:
+                manifest = {
+                    "format": SNAPSHOT_FORMAT,
+                    "dim": int(embeddings.shape[1]),
+                    "count": 0,
+                    "generation": generation,
+                    "collection": collection.name,
+                }
+            manifest = _append_rows(tmp_path, manifest, page["ids"], embeddings, page["documents"], page["metadatas"])
+
+        if manifest is None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+
+        # Swap directories; processes still holding the old memmaps keep reading the unlinked files
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logger.info(f"-> Built index snapshot for Test ID {test_id}: {manifest['count']} rows")
+
+
+def build_snapshot_in_background(test_id: str):
+    """Fire-and-forget hydration after a snapshot miss (one build per test per process)"""
+    test_id = _snapshot_key(test_id) if snapshots_enabled() else None
+    if test_id is None:
+        return
+
+    with _hydrating_lock:
+        if test_id in _hydrating:
+            return
+        _hydrating.add(test_id)
+
+    def run():
+        try:
+            build_snapshot(test_id)
+        except Exception as e:
+            logger.error(f"Building index snapshot for Test ID {test_id} failed: {e}")
+        finally:
+            with _hydrating_lock:
+                _hydrating.discard(test_id)
+
+    threading.Thread(target=run, name=f"snapshot-{test_id}", daemon=True).start()
+
+
+def delete_snapshot(test_id: str):
+    """
+    Drops a test's snapshot (used when its vectors are deleted or re-indexed).
+    Bumping the generation makes every other pod treat its own copy as stale too.
+    """
+    test_id = _snapshot_key(test_id) if snapshots_enabled() else None
+    if test_id is None:
+        return
+    if redis_state.redis_client is not None:
+        try:
+            redis_state.redis_client.incr(REDIS_GENERATION_PREFIX + test_id)
+        except Exception as e:
+            logger.warning(f"Redis generation bump failed, other pods may serve a stale snapshot of Test ID {test_id}: {e}")
+    with _test_lock(test_id):
+        shutil.rmtree(_snapshot_path(test_id), ignore_errors=True)
+    with _open_lock:
+        _open_snapshots.pop(test_id, None)
+
+
+def warm_snapshots(limit: int = 100):
+    """Asks the kernel to read the most recently used snapshot vectors into the page cache"""
+    if not snapshots_enabled() or not os.path.isdir(INDEX_SNAPSHOT_DIR):
+        return 0
+
+    vector_files = []
+    for entry in os.scandir(INDEX_SNAPSHOT_DIR):
+        vectors_path = os.path.join(entry.path, "vectors.f32")
+        if entry.is_dir() and os.path.exists(vectors_path):
+            vector_files.append((os.stat(vectors_path).st_mtime, vectors_path))
+
+    warmed = 0
+    for _, vectors_path in sorted(vector_files, reverse=True)[:limit]:
+        fd = os.open(vectors_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            warmed += 1
+        finally:
+            os.close(fd)
+    return warmed
@@ -0,0 +1,254 @@
+import os
+import time
+import random
+import asyncio
+import functools
+import threading
+from collections import deque
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from loguru import logger
+import utils.rag_initialization as rag_state
+from utils.metrics import LLM_REQUESTS
+
+load_dotenv()
+
+# --- LLM Client Configuration ---
+DEFAULT_MODEL_NAME = "gemini-2.5-flash"
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))      # budget for one generate_content() call incl. retries
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))  # budget shared by all LLM calls of one HTTP request
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "16"))                # dedicated threads, so a brownout can't starve the default executor
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "4"))
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "8"))  # used until enough samples exist
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+_request_deadline: ContextVar = ContextVar("llm_request_deadline", default=None)
+
+
+@functools.lru_cache(maxsize=1)
+def retryable_errors():
+    """Errors worth retrying / hedging: provider overload, transient server faults, network hiccups"""
+    # Imported lazily: google.api_core pulls in grpc, which we keep out of process startup
+    from google.api_core import exceptions as google_exceptions
+    return (
+        asyncio.TimeoutError,
+        TimeoutError,
+        ConnectionError,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.BadGateway,
+        google_exceptions.GatewayTimeout,
+    )
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the LLM cannot answer within the deadline or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker. After BREAKER_FAILURE_THRESHOLD consecutive failures it opens and
+    every call fails fast; after BREAKER_RESET_SECONDS a single probe call is let through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Frees the half-open probe slot when the probe ended without a verdict (e.g. it was cancelled)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"LLM circuit breaker opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies; drives the hedging delay"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> float:
+        if len(self.samples) < self.min_samples:
+            return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_PERCENTILE / 100))
+        return ordered[index]
+
+
+breaker = CircuitBreaker()
+latency_tracker = LatencyTracker()
+
+
+@functools.lru_cache(maxsize=32)
+def get_model(model_name: str = DEFAULT_MODEL_NAME, system_instruction: str = None):
+    """GenerativeModel instances are immutable config holders, so build each (model, instruction) pair once"""
+    genai = rag_state.load_genai()
+    if system_instruction:
+        return genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+    return genai.GenerativeModel(model_name=model_name)
+
+
+def start_request_deadline(seconds: float = REQUEST_DEADLINE_SECONDS):
+    """Sets the LLM budget for the current request (contextvar); returns a token for reset_request_deadline"""
+    return _request_deadline.set(time.monotonic() + seconds)
+
+
+def reset_request_deadline(token):
+    _request_deadline.reset(token)
+
+
+def _remaining_budget(timeout: float) -> float:
+    remaining = timeout
+    request_deadline = _request_deadline.get()
+    if request_deadline is not None:
+        remaining = min(remaining, request_deadline - time.monotonic())
+    return remaining
+
+
+async def _hedged_call(model, prompt, remaining: float, kwargs):
+    """
+    Runs generate_content on the LLM executor. If no answer arrives within the hedge delay
+    (recent p95 latency) a second identical request is fired and the first answer wins.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    deadline = started + remaining
+
+    def submit():
+        # request_options timeout makes the SDK give up too, so the worker thread is released
+        call = functools.partial(model.generate_content, prompt, request_options={"timeout": max(1.0, deadline - time.monotonic())}, **kwargs)
+        return loop.run_in_executor(_executor, call)
+
+    pending = {submit()}
+    hedge_at = started + latency_tracker.hedge_delay() if LLM_HEDGING_ENABLED else None
+    last_error = None
+
+    while pending:
+        now = time.monotonic()
+        wait_until = min(deadline, hedge_at) if hedge_at else deadline
+        if wait_until <= now and wait_until == deadline:
+            break
+
+        done, pending = await asyncio.wait(pending, timeout=max(0.0, wait_until - now), return_when=asyncio.FIRST_COMPLETED)
+
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                latency_tracker.record(time.monotonic() - started)
+                return task.result()
+            last_error = task.exception()
+
+        if not done and hedge_at and time.monotonic() >= hedge_at:
+            logger.info("LLM call slower than hedge delay, sending hedged request")
+            LLM_REQUESTS.labels(outcome="hedged").inc()
+            pending.add(submit())
+            hedge_at = None
+
+    for task in pending:
+        task.cancel()
+    if last_error is not None:
+        raise last_error
+    raise asyncio.TimeoutError()
+
+
+async def generate_content(prompt, *, model_name: str = DEFAULT_MODEL_NAME, system_instruction: str = None,
+                           timeout: float = LLM_TIMEOUT_SECONDS, **kwargs):
+    """
+    Deadline-bounded, hedged, retried and circuit-broken replacement for
+    asyncio.to_thread(model.generate_content, prompt). Extra kwargs (e.g. generation_config)
+    are passed to the SDK. Raises LLMUnavailableError when no answer can be produced in time.
+    """
+    if not breaker.allow():
+        LLM_REQUESTS.labels(outcome="circuit_open").inc()
+        raise LLMUnavailableError("LLM circuit breaker is open")
+
+    # Every exit path must settle the breaker, or a half-open probe would hold its slot forever
+    settled = False
+    try:
+        model = get_model(model_name, system_instruction)
+        call_started = time.monotonic()
+        last_error = None
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            remaining = _remaining_budget(timeout - (time.monotonic() - call_started))
+            if remaining <= 0:
+                break
+
+            try:
+                response = await _hedged_call(model, prompt, remaining, kwargs)
+                breaker.record_success()
+                settled = True
+                LLM_REQUESTS.labels(outcome="success").inc()
+                return response
+            except Exception as e:
+                if not isinstance(e, retryable_errors()):
+                    # Bad request, safety block, auth error... retrying won't help, but the provider answered
+                    breaker.record_success()
+                    settled = True
+                    LLM_REQUESTS.labels(outcome="error").inc()
+                    raise
+                last_error = e
+                logger.warning(f"LLM attempt {attempt + 1} failed: {type(e).__name__}: {e}")
+
+            # Full jitter backoff, but never sleep past the remaining budget
+            backoff = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+            if attempt < LLM_MAX_RETRIES and backoff < _remaining_budget(timeout - (time.monotonic() - call_started)):
+                await asyncio.sleep(backoff)
+
+        breaker.record_failure()
+        settled = True
+        LLM_REQUESTS.labels(outcome="timeout" if last_error is None or isinstance(last_error, (asyncio.TimeoutError, TimeoutError)) else "unavailable").inc()
+        raise LLMUnavailableError(f"LLM did not answer within its deadline: {type(last_error).__name__ if last_error else 'budget exhausted'}")
+    finally:
+        if not settled:
+            # Cancelled (client disconnect) or failed before reaching the provider: no verdict either way
+            breaker.release()
@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import functools
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from loguru import logger
+from opentelemetry import trace
+from prometheus_client import Counter, Histogram, CollectorRegistry, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+
+load_dotenv()
+
+# --- Metric Definitions ---
+# Exposed in Prometheus text format on /metrics. Cache hit ratio is
+# rate(rag_cache_requests_total{result="hit"}) / rate(rag_cache_requests_total).
+
+STAGE_DURATION = Histogram(
+    "rag_stage_duration_seconds",
+    "Wall-clock duration of each pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STAGE_ERRORS = Counter(
+    "rag_stage_errors_total",
+    "Exceptions raised out of a pipeline stage",
+    ["stage"],
+)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    ["cache", "result"],
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "rag_embedding_batch_size",
+    "Number of texts sent to the embedding model per encode() call",
+    ["stage"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048),
+)
+INGEST_CHUNKS = Histogram(
+    "rag_ingest_chunks",
+    "Number of chunks produced per ingested document",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+LLM_REQUESTS = Counter(
+    "rag_llm_requests_total",
+    "LLM client outcomes (success, error, timeout, unavailable, circuit_open, hedged)",
+    ["outcome"],
+)
+STRUCTURED_OUTPUT = Counter(
+    "rag_structured_output_total",
+    "LLM JSON outputs by schema and parse path (fast, repaired, failed)",
+    ["schema", "outcome"],
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "LLM tokens consumed, by endpoint, stage and direction (in/out)",
+    ["endpoint", "stage", "direction"],
+)
+
+# --- Tracing ---
+# Spans are no-ops unless TRACING_ENABLED is set, in which case they are exported over OTLP
+# (endpoint taken from the standard OTEL_EXPORTER_OTLP_ENDPOINT variable).
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+tracer = trace.get_tracer("rag-pipeline")
+
+
+def tracing_init():
+    """Installs an OTLP span exporter when tracing is enabled"""
+    if not TRACING_ENABLED:
+        return
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    except ImportError as e:
+        logger.warning(f"Tracing requested but OpenTelemetry SDK is unavailable: {e}")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "rag-pipeline"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    logger.info("Tracing initialized with OTLP exporter")
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Times a block of code into the stage histogram and wraps it in a trace span"""
+    start = time.perf_counter()
+    with tracer.start_as_current_span(stage):
+        try:
+            yield
+        except Exception:
+            STAGE_ERRORS.labels(stage=stage).inc()
+            raise
+        finally:
+            STAGE_DURATION.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def instrumented(stage: str):
+    """Decorator version of track_stage for both sync and async functions"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track_stage(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            with track_stage(stage):
+                return func(*args, **kwargs)
+        return sync_wrapper
+    return decorator
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_llm_usage(endpoint: str, stage: str, response):
+    """Reads token counts from a Gemini response's usage_metadata (if present)"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    LLM_TOKENS.labels(endpoint=endpoint, stage=stage, direction="in").inc(getattr(usage, "prompt_token_count", 0) or 0)
+    LLM_TOKENS.labels(endpoint=endpoint, stage=stage, direction="out").inc(getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def render_metrics():
+    """Returns (body, content_type) for the /metrics endpoint"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Multi-worker mode (gunicorn.conf.py): aggregate the samples every worker wrote to disk
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,28 @@
+import time
+import importlib
+from loguru import logger
+import utils.rag_initialization as rag_state
+from utils.index_snapshot import warm_snapshots
+
+
+def preload_shared_state():
+    """
+    Runs once in the gunicorn master BEFORE workers are forked (preload mode).
+    Only fork-safe state belongs here: module imports and read-only / memory-mapped data.
+    Network clients (Chroma, Gemini gRPC, Redis) are created per worker in lifespan.
+    """
+    start = time.perf_counter()
+
+    # Import heavy libraries once; forked workers share these pages copy-on-write
+    for module_name in rag_state.HEAVY_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            logger.warning(f"preload: could not import {module_name}: {e}")
+
+    # Start reading the most recent index snapshots into the page cache (shared by all workers)
+    warmed = warm_snapshots()
+    if warmed:
+        logger.info(f"preload: warming {warmed} index snapshots")
+
+    logger.info(f"preload: shared state ready in {time.perf_counter() - start:.2f}s")
@@ -1,21 +1,36 @@
 import uuid
 from typing import Dict,Any
 import utils.rag_initialization as rag_state
+from utils.index_snapshot import record_ingestion
+from utils.vector_store import get_write_collection, index_settings, MIN_CHUNK_CHARS
+from utils.metrics import instrumented, track_stage, INGEST_CHUNKS, EMBEDDING_BATCH_SIZE
 from loguru import logger
 
 
-def process_text_pipeline(text: str, metadata: Dict[str, Any]):
+@instrumented("process_text_pipeline")
+def process_text_pipeline(text: str, metadata: Dict[str, Any], collection=None, update_snapshot: bool = True,
+                          source_id: str = None):
     """
     Processing Pipeline: Chunk (Sliding Window) -> Embed (SentenceTransformers) -> Store (Chroma)
+    Returns the number of chunks stored.
+    `collection` is the already resolved write target (ingestion) or a specific index version
+    (background rebuilds, which pass update_snapshot=False: the local snapshot mirrors the live version).
+    `source_id` is only passed when re-processing a stored source, so versions can be compared by source.
     """
     if not text.strip():
-        return
+        return 0
+
+    # Writes go to the test's own partition (created on first ingestion), see utils.vector_store
+    if collection is None:
+        collection = get_write_collection(metadata.get("test_id"), metadata.get("tenant_id"))
+    settings = index_settings(collection)
         
     # --- 1. Intelligent Chunking (Sliding Window) ---
-    # Size: 1000 chars (approx 200-300 words), Overlap: 200 chars
+    # Default size: 1000 chars (approx 200-300 words), Overlap: 200 chars.
+    # A test re-indexed with other settings keeps using them for new ingestions.
     # Overlap ensures context isn't lost if a sentence is split at the chunk boundary.
-    chunk_size = 1000
-    overlap = 200
+    chunk_size = settings["chunk_size"]
+    overlap = settings["chunk_overlap"]
     chunks = []
 
     #ChromaDB cloud has a one time hard limit of 300 records
@@ -25,17 +40,21 @@ def process_text_pipeline(text: str, metadata: Dict[str, Any]):
     for i in range(0, len(text), chunk_size - overlap):
         chunk = text[i:i + chunk_size]
         # Ignore very small trailing chunks (e.g. whitespace or just a few chars)
-        if len(chunk) > 50: 
+        if len(chunk) > MIN_CHUNK_CHARS: 
             chunks.append(chunk)
 
     if not chunks:
-        return
+        return 0
+
+    INGEST_CHUNKS.observe(len(chunks))
 
     # --- 2. Generate Embeddings ---
-    # encode() returns a list of vectors (numpy arrays). We convert to list for JSON serialization compatibility if needed, 
-    # though Chroma handles numpy arrays usually. .tolist() is safer.
+    # encode() returns a contiguous (n_chunks, dim) float32 matrix. We keep it as-is:
+    # Chroma accepts float32 arrays directly, and .tolist() would box every value into a Python float.
     logger.info(f"Generating embeddings for {len(chunks)} chunks...")
-    embeddings = rag_state.embedding_model.encode(chunks).tolist()
+    EMBEDDING_BATCH_SIZE.labels(stage="ingestion").observe(len(chunks))
+    with track_stage("ingestion_embedding"):
+        embeddings = rag_state.get_embedding_model(settings["embedding_model"]).encode(chunks)
 
     # --- 3. Store in ChromaDB ---
     # Prepare IDs and Metadata for each chunk
@@ -51,7 +70,10 @@ def process_text_pipeline(text: str, metadata: Dict[str, Any]):
         else:
             safe_metadata[k] = str(v) # Convert complex types to string
 
-    metadatas = [safe_metadata for _ in chunks]
+    # source_id + chunk_index + chunk_overlap let a re-index stitch the original text back together.
+    # Never taken from the metadata: a client-supplied source_id shared by two texts would interleave their chunks.
+    safe_metadata["source_id"] = str(source_id or uuid.uuid4())
+    metadatas = [dict(safe_metadata, chunk_index=i, chunk_overlap=overlap) for i in range(len(chunks))]
 
    # --- 4. Store in ChromaDB (Batched) ---
     total_records = len(chunks)
@@ -62,21 +84,33 @@ def process_text_pipeline(text: str, metadata: Dict[str, Any]):
         
         # Slice the lists to create a batch
         batch_documents = chunks[i:batch_end]
-        batch_embeddings = embeddings[i:batch_end]
+        batch_embeddings = embeddings[i:batch_end] # numpy view, no copy
         batch_metadatas = metadatas[i:batch_end]
         batch_ids = ids[i:batch_end]
         
         try:
-            rag_state.collection.add(
-                documents=batch_documents,
-                embeddings=batch_embeddings,
-                metadatas=batch_metadatas,
-                ids=batch_ids
-            )
+            with track_stage("ingestion_storage"):
+                collection.add(
+                    documents=batch_documents,
+                    embeddings=batch_embeddings,
+                    metadatas=batch_metadatas,
+                    ids=batch_ids
+                )
             logger.info(f"-> Batch {i//CHROMA_BATCH_LIMIT + 1}: Stored records {i} to {min(batch_end, total_records)}")
         except Exception as e:
             logger.error(f"Error adding batch {i} to {batch_end}: {e}")
             # Optional: You might want to raise the error or continue depending on your requirements
             raise e
         
-    logger.info(f"-> Successfully completed storage of {total_records} chunks for Test ID: {metadata.get('test_id')}")
\ No newline at end of file
+    logger.info(f"-> Successfully completed storage of {total_records} chunks for Test ID: {metadata.get('test_id')}")
+
+    # --- 5. Keep the local memory-mapped snapshot in sync (no-op unless INDEX_SNAPSHOT_DIR is set) ---
+    if not update_snapshot:
+        return total_records
+    try:
+        record_ingestion(metadata.get("test_id"), ids, embeddings, chunks, metadatas, collection_name=collection.name)
+    except Exception as e:
+        # Chroma is the source of truth; a broken snapshot only costs a rebuild later
+        logger.error(f"Failed to update index snapshot: {e}")
+
+    return total_records
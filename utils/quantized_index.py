@@ -0,0 +1,138 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Storage precision for local vector indexes: "float32" (exact), "float16" (half the memory)
+# or "int8" (a quarter of the memory, plus one float32 scale per vector).
+VECTOR_STORAGE_DTYPE = os.getenv("VECTOR_STORAGE_DTYPE", "float32").lower()
+SUPPORTED_STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# How many extra candidates the quantized scan keeps for exact float32 rescoring (top_k * factor)
+RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+
+# Rows are dequantized in blocks so a search never materializes the whole matrix in float32
+SEARCH_BLOCK_ROWS = 4096
+
+
+def quantize_embeddings(embeddings, storage_dtype: str = VECTOR_STORAGE_DTYPE):
+    """
+    Converts a (n, dim) float32 matrix to the requested storage precision.
+    Returns (codes, scales). scales is None unless storage_dtype is int8 (symmetric, per vector).
+    """
+    if storage_dtype not in SUPPORTED_STORAGE_DTYPES:
+        raise ValueError(f"Unsupported vector storage dtype: {storage_dtype}")
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+
+    if storage_dtype == "float32":
+        return matrix, None
+    if storage_dtype == "float16":
+        return matrix.astype(np.float16), None
+
+    # int8: map [-max|x|, +max|x|] of each vector onto [-127, 127]
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0 # all-zero vectors would otherwise divide by zero
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_embeddings(codes, scales=None):
+    """Inverse of quantize_embeddings (lossy for float16/int8). Always returns float32."""
+    matrix = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        matrix = matrix * np.asarray(scales, dtype=np.float32)[:, None]
+    return matrix
+
+
+class QuantizedIndex:
+    """
+    Brute-force local vector index with compact storage.
+    Candidates are found on the quantized codes, then the best top_k * RESCORE_FACTOR are
+    rescored exactly against the float32 source (which may be a numpy.memmap, so only the
+    touched rows are paged in). Distances are squared L2, matching Chroma's default space.
+    """
+
+    def __init__(self, ids, embeddings, storage_dtype: str = VECTOR_STORAGE_DTYPE, rescore_source=None):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(ids) != matrix.shape[0]:
+            raise ValueError("ids and embeddings must describe the same number of vectors")
+
+        # Any indexable sequence works (e.g. a lazily decoded on-disk id table)
+        self.ids = ids
+        self.dim = matrix.shape[1]
+        self.storage_dtype = storage_dtype
+        self.codes, self.scales = quantize_embeddings(matrix, storage_dtype)
+
+        # Exact squared norms are cheap (one float per vector) and tighten the approximate distances
+        self.norms = np.einsum("ij,ij->i", matrix, matrix).astype(np.float32)
+
+        # Full-precision vectors for rescoring. With float32 storage the codes ARE the exact vectors.
+        # Otherwise callers pass a memmap (or nothing, in which case we return approximate distances).
+        if storage_dtype == "float32":
+            self.rescore_source = self.codes
+        else:
+            self.rescore_source = rescore_source
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Resident bytes of the quantized index (excluding a memory-mapped rescore source)."""
+        total = self.codes.nbytes + self.norms.nbytes
+        if self.scales is not None:
+            total += self.scales.nbytes
+        return total
+
+    def _approximate_dot(self, query):
+        dots = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+            end = start + SEARCH_BLOCK_ROWS
+            block = self.codes[start:end].astype(np.float32, copy=False)
+            dots[start:end] = block @ query
+        if self.scales is not None:
+            dots *= self.scales
+        return dots
+
+    def search(self, query_vector, top_k: int):
+        """Returns (ids, distances) of the top_k nearest vectors, closest first."""
+        rows, distances = self.search_rows(query_vector, top_k)
+        return [self.ids[row] for row in rows], distances
+
+    def search_rows(self, query_vector, top_k: int):
+        """Like search(), but returns row numbers instead of ids."""
+        if len(self.ids) == 0 or top_k <= 0:
+            return [], []
+
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match index dimension {self.dim}")
+
+        # --- 1. Approximate scan on the compact codes ---
+        distances = self.norms - 2.0 * self._approximate_dot(query) + float(query @ query)
+
+        exact = self.rescore_source is not None
+        n_candidates = min(len(self.ids), top_k * RESCORE_FACTOR if exact and self.storage_dtype != "float32" else top_k)
+        candidates = np.argpartition(distances, n_candidates - 1)[:n_candidates]
+
+        # --- 2. Exact float32 rescoring of the shortlist ---
+        if exact and self.storage_dtype != "float32":
+            candidates = np.sort(candidates) # sequential reads are kinder to a memmap
+            rows = np.asarray(self.rescore_source[candidates], dtype=np.float32)
+            diff = rows - query
+            distances_shortlist = np.einsum("ij,ij->i", diff, diff)
+        else:
+            if not exact:
+                logger.debug("QuantizedIndex has no float32 source, returning approximate distances")
+            distances_shortlist = distances[candidates]
+
+        order = np.argsort(distances_shortlist)[:top_k]
+        return (
+            [int(i) for i in candidates[order]],
+            [max(float(d), 0.0) for d in distances_shortlist[order]],
+        )
@@ -1,9 +1,16 @@
 import utils.rag_initialization as rag_state
-import asyncio
-from .parse_markdown_json import parse_markdown_json
 from loguru import logger
 import utils.redis_init as redis_state
+from utils.llm_client import generate_content
+from utils.metrics import instrumented, record_cache, record_llm_usage
 
+EXPANSION_INSTRUCTION = (
+    "You are an AI assistant that helps users to provide with a generalized answer to their query."
+    "You have to provide answer that is relevant to the query"
+    "You can use different sources to get the answer"
+)
+
+@instrumented("query_expansion")
 async def query_expansion(query):
     """This function takes the user query and gives it to LLM to get a generalized
     answer to be passed along with the original user query"""
@@ -13,21 +20,14 @@ async def query_expansion(query):
     if rag_state.GEMINI_API_KEY: 
         
         cached_response = redis_state.redis_client.get(f"{query}")
+        record_cache("query_expansion", bool(cached_response))
         if cached_response:
             logger.info("Found generalized answer in redis cache using it...")
             return cached_response
 
         try:
-            model = rag_state.genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            system_instruction=(
-               "You are an AI assistant that helps users to provide with a generalized answer to their query."
-               "You have to provide answer that is relevant to the query"
-               "You can use different sources to get the answer"
-                )
-            )
-            
-            response = await asyncio.to_thread(model.generate_content,query)
+            response = await generate_content(query, system_instruction=EXPANSION_INSTRUCTION)
+            record_llm_usage("/retrieve", "query_expansion", response)
 
             if response.parts:
                 redis_state.redis_client.set(f"{query}",f"{response.text}",ex=864000)
@@ -37,6 +37,9 @@ async def query_expansion(query):
                 return ""
 
         except Exception as e:
+            # Degrade to the raw candidate answer: retrieval still works, just without expansion
             logger.error(f"Error in query expansion: {e}")
+            return ""
 
+    return ""
 
@@ -1,10 +1,6 @@
-import chromadb
 import os
-from chromadb.config import Settings
-
-import google.generativeai as genai
+import importlib
 from dotenv import load_dotenv
-from chromadb.utils import embedding_functions
 import numpy as np
 from loguru import logger
 
@@ -16,8 +12,25 @@ load_dotenv()
 # 1. Define globals as None initially
 embedding_model = None
 chroma_client = None
-collection = None
+collection = None # the shared collection; per-test partitions are routed by utils.vector_store
 GEMINI_API_KEY = None
+# google.generativeai is bound on first use (see load_genai) so importing this module stays cheap
+genai = None
+
+# Heavy third-party modules, imported lazily on first use. In multi-worker mode
+# utils.preload imports them once in the master so forked workers share the pages.
+HEAVY_MODULES = ("chromadb", "google.generativeai", "pypdf", "docx")
+
+# Embedding model used unless a test's index was rebuilt with another one (see utils.vector_store)
+DEFAULT_EMBEDDING_MODEL = "models/text-embedding-004"
+# Models a test may be re-indexed with; EXTRA_EMBEDDING_MODELS (comma-separated) adds newer ones
+SUPPORTED_EMBEDDING_MODELS = [DEFAULT_EMBEDDING_MODEL, "models/gemini-embedding-001", "models/embedding-001"] + [
+    m.strip() for m in os.getenv("EXTRA_EMBEDDING_MODELS", "").split(",") if m.strip()
+]
+_embedding_models = {}
+
+# Original single collection holding every tenant's chunks (filtered by test_id metadata)
+SHARED_COLLECTION_NAME = "rag_knowledge_base_v1"
 
 # 1. Define the Adapter Class
 class GoogleEmbeddingAdapter:
@@ -35,18 +48,48 @@ class GoogleEmbeddingAdapter:
         # 3. Get embeddings (Google always returns a list of lists)
         embeddings = self.google_func(documents)
 
-        # 4. CRITICAL FIX: If input was a single string, return a 1D array.
+        # 4. Pack into one contiguous float32 buffer. np.array() on the raw
+        # list would give float64 (twice the memory) and Chroma stores float32 anyway.
+        matrix = np.asarray(embeddings, dtype=np.float32)
+
+        # 5. CRITICAL FIX: If input was a single string, return a 1D array.
         # This matches SentenceTransformer behavior exactly.
         if is_single_string:
-            return np.array(embeddings[0])
+            return matrix[0]
         
         # Otherwise return the 2D array
-        return np.array(embeddings)
+        return matrix
+
+def load_genai():
+    """Imports google.generativeai on first use (unless something, e.g. the benchmark stubs, already set it)"""
+    global genai
+    if genai is None:
+        genai = importlib.import_module("google.generativeai")
+    return genai
+
+
+def get_embedding_model(model_name: str = None):
+    """The default adapter, or one built (once) for another Google embedding model"""
+    if not model_name or model_name == DEFAULT_EMBEDDING_MODEL:
+        return embedding_model
+    if model_name not in _embedding_models:
+        from chromadb.utils import embedding_functions
+        _embedding_models[model_name] = GoogleEmbeddingAdapter(embedding_functions.GoogleGenerativeAiEmbeddingFunction(
+            api_key=GEMINI_API_KEY,
+            model_name=model_name,
+            task_type="RETRIEVAL_DOCUMENT"
+        ))
+    return _embedding_models[model_name]
+
 
 def rag_initialization():
     """Initializes global variables"""
     global embedding_model, chroma_client, collection, GEMINI_API_KEY
 
+    import chromadb
+    from chromadb.utils import embedding_functions
+    load_genai()
+
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     if GEMINI_API_KEY:
         genai.configure(api_key=GEMINI_API_KEY)
@@ -56,7 +99,7 @@ def rag_initialization():
     logger.info("Loading embedding model...")
     embedding_model = GoogleEmbeddingAdapter(embedding_functions.GoogleGenerativeAiEmbeddingFunction(
         api_key=GEMINI_API_KEY,
-        model_name="models/text-embedding-004",
+        model_name=DEFAULT_EMBEDDING_MODEL,
         task_type="RETRIEVAL_DOCUMENT" # Optimizes embeddings for storage/retrieval
     ))
 
@@ -76,7 +119,7 @@ def rag_initialization():
                 api_key=CHROMA_DB_CLOUD,
                 tenant= CHROMA_DB_TENANT,
                 database= CHROMA_DB_NAME)
-            collection = chroma_client.get_or_create_collection(name="rag_knowledge_base_v1")
+            collection = chroma_client.get_or_create_collection(name=SHARED_COLLECTION_NAME)
 
         except Exception as e:
             raise Exception("Failed to load ChromaDB client")
@@ -0,0 +1,128 @@
+import os
+import functools
+from pydantic import TypeAdapter, ValidationError
+from dotenv import load_dotenv
+from loguru import logger
+import utils.rag_initialization as rag_state
+from utils.metrics import STRUCTURED_OUTPUT
+
+load_dotenv()
+
+# Outputs longer than this are not worth repairing (the model went off the rails)
+STRUCTURED_REPAIR_MAX_CHARS = int(os.getenv("STRUCTURED_REPAIR_MAX_CHARS", "200000"))
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class StructuredOutputError(ValueError):
+    """Raised when an LLM output can't be turned into the expected model, even after repair"""
+
+
+def json_generation_config(schema: dict):
+    """
+    generation_config asking Gemini for JSON that follows `schema` (OpenAPI subset:
+    type / properties / items / required / enum). Decoding is constrained server side,
+    so the fast path below almost always succeeds.
+    """
+    return rag_state.load_genai().GenerationConfig(response_mime_type="application/json", response_schema=schema)
+
+
+@functools.lru_cache(maxsize=32)
+def _adapter(model):
+    return TypeAdapter(model)
+
+
+def repair_json(text: str) -> list:
+    """
+    Bounded, single-pass fixes for the usual LLM JSON slips: markdown fences or prose around
+    the payload and trailing commas. For output truncated mid-value it returns a few candidates:
+    everything closed as-is first, then cut back to the last complete element, one nesting level
+    at a time. Linear in the input size, never calls the model again.
+    """
+    text = text.strip()
+
+    # 1. Drop a leading ```json fence and whatever follows the closing one (non-greedy)
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        fence_end = text.find("```")
+        if fence_end != -1:
+            text = text[:fence_end]
+
+    # 2. Cut prose before the first bracket
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return [text]
+    text = text[min(starts):]
+
+    # 3. One walk, string aware: drop trailing commas, stop once the top-level value closes,
+    #    remember the last comma of every open bracket so a truncated tail can be cut back
+    out = []
+    stack = []
+    in_string = escaped = False
+    commas = {} # depth -> length of out at the last comma directly inside that bracket
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            # a trailing comma right before a closer is invalid JSON
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            commas.pop(len(stack), None)
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                return ["".join(out)]
+            continue
+        elif char == ",":
+            commas[len(stack)] = len(out)
+        out.append(char)
+
+    # 4. Truncated output: close what is still open, or drop the incomplete element
+    closed = "".join(out) + ('"' if in_string else "")
+    candidates = [closed.rstrip().rstrip(",") + "".join(reversed(stack))]
+    for depth in sorted(commas, reverse=True):
+        candidates.append("".join(out[:commas[depth]]).rstrip() + "".join(reversed(stack[:depth])))
+    return candidates
+
+
+def parse_structured(text: str, model, schema_name: str):
+    """
+    Validates an LLM output straight into `model` (a pydantic model or e.g. List[Model]).
+    Fast path: one validate_json call (no regex, no intermediate dict). On failure the
+    repair_json candidates are tried before giving up with StructuredOutputError.
+    """
+    adapter = _adapter(model)
+    try:
+        result = adapter.validate_json(text)
+        STRUCTURED_OUTPUT.labels(schema=schema_name, outcome="fast").inc()
+        return result
+    except ValidationError as e:
+        first_error = e
+
+    if len(text) <= STRUCTURED_REPAIR_MAX_CHARS:
+        for candidate in repair_json(text):
+            try:
+                result = adapter.validate_json(candidate)
+            except ValidationError:
+                continue
+            STRUCTURED_OUTPUT.labels(schema=schema_name, outcome="repaired").inc()
+            logger.info(f"Repaired malformed {schema_name} JSON from the LLM")
+            return result
+
+    STRUCTURED_OUTPUT.labels(schema=schema_name, outcome="failed").inc()
+    raise StructuredOutputError(f"LLM output is not a valid {schema_name}: {first_error.errors()[0].get('msg')}")
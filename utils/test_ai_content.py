@@ -1,14 +1,35 @@
 
 import os
-import json
-import requests
+import httpx
 from dotenv import load_dotenv
 from loguru import logger
+from utils.metrics import instrumented
 
 
 load_dotenv()
 
-def zero_gpt_test(text):
+ZERO_GPT_TIMEOUT_SECONDS = float(os.getenv("ZERO_GPT_TIMEOUT_SECONDS", "10"))
+
+# One pooled client for the process: reuses TCP/TLS connections instead of a handshake per answer
+_http_client = None
+
+
+def get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=ZERO_GPT_TIMEOUT_SECONDS)
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+@instrumented("zero_gpt_test")
+async def zero_gpt_test(text):
     ZERO_GPT_API_KEY = os.getenv("ZERO_GPT_API_KEY")
     ZERO_GPT_URL = os.getenv("ZERO_GPT_URL")
     if ZERO_GPT_API_KEY and ZERO_GPT_URL:
@@ -17,13 +38,13 @@ def zero_gpt_test(text):
             'ApiKey': ZERO_GPT_API_KEY,
         }
 
-        payload = json.dumps({
+        payload = {
                     "input_text": text
-                    })
-        
+                    }
+
         try:
-            response = requests.request("POST", ZERO_GPT_URL, headers=headers, data=payload)
-            
+            response = await get_http_client().post(ZERO_GPT_URL, headers=headers, json=payload)
+
             if response.status_code == 200:
                 data = response.json()
                 # GPTZero returns a probability (0 to 1)
@@ -32,7 +53,11 @@ def zero_gpt_test(text):
             else:
                 logger.warning("Zero GPT API error")
                 return -1
-                
+
+        except httpx.TimeoutException:
+            logger.error(f"Zero GPT timed out after {ZERO_GPT_TIMEOUT_SECONDS}s")
+            return -1
+
         except Exception as e:
             logger.error("Zero GPT connection failed")
             return -1
@@ -42,4 +67,4 @@ def zero_gpt_test(text):
             logger.warning("ZERO GPT API KEY not found")
         else:
             logger.warning("ZERO GPT URL not found")
-        return -1
\ No newline at end of file
+        return -1
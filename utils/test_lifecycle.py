@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from loguru import logger
+import utils.rag_initialization as rag_state
+import utils.redis_init as redis_state
+from utils.index_snapshot import delete_snapshot
+from utils.process_text_pipeline import process_text_pipeline
+from utils.metrics import instrumented
+from utils.vector_store import (
+    PARTITION_ROUTE_TTL, partitioning_enabled, resolve_collection, migrate_test, delete_test,
+    create_version, activate_version, retire_version, pending_retirements, get_collection_or_none,
+    iter_sources, list_source_ids,
+)
+
+load_dotenv()
+
+# --- Admin Jobs (delete / re-index a test) ---
+ADMIN_JOB_WORKERS = int(os.getenv("ADMIN_JOB_WORKERS", "1"))  # jobs run one after another per process by default
+REINDEX_MAX_CHUNKS_PER_SECOND = float(os.getenv("REINDEX_MAX_CHUNKS_PER_SECOND", "50"))  # embedding + write rate cap
+REINDEX_CATCH_UP_PASSES = 3  # re-scans for chunks ingested into the live version during a rebuild
+# In-flight requests (and, without Redis, route caches until their TTL) may still write to the
+# previous version after a swap, so it is drained into the live one and dropped later
+VERSION_RETIRE_DELAY_SECONDS = float(os.getenv("VERSION_RETIRE_DELAY_SECONDS", str(PARTITION_ROUTE_TTL + 60)))
+RETIRE_SWEEP_SECONDS = float(os.getenv("RETIRE_SWEEP_SECONDS", "60"))
+ADMIN_JOB_TTL = 7 * 24 * 3600   # how long job status stays queryable
+ADMIN_JOB_LOCK_TTL = 3600       # refreshed on progress, so a dead worker doesn't block the test forever
+
+REDIS_JOB_PREFIX = "admin_job:"
+REDIS_JOB_LOCK_PREFIX = "admin_job_lock:"
+REDIS_RETIRE_QUEUE = "partition_retiring"  # sorted set of "<test_id> <collection>", scored by due time
+
+_executor = ThreadPoolExecutor(max_workers=ADMIN_JOB_WORKERS, thread_name_prefix="admin-job")
+_jobs = {}           # job_id -> job dict (this process)
+_busy_tests = set()  # test_ids with a queued/running job in this process
+_jobs_lock = threading.Lock()
+_sweeper_started = False
+
+
+class JobConflictError(Exception):
+    """Raised when a job is already queued or running for the test"""
+
+
+def _save(job: dict):
+    job["updated_at"] = time.time()
+    with _jobs_lock:
+        _jobs[job["job_id"]] = dict(job)
+    if redis_state.redis_client is None:
+        return
+    try:
+        pipe = redis_state.redis_client.pipeline()
+        pipe.set(REDIS_JOB_PREFIX + job["job_id"], json.dumps(job), ex=ADMIN_JOB_TTL)
+        if job["status"] in ("queued", "running"):
+            pipe.expire(REDIS_JOB_LOCK_PREFIX + job["test_id"], ADMIN_JOB_LOCK_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis store of admin job {job['job_id']} failed: {e}")
+
+
+def get_job(job_id: str):
+    """Job status from this process, or from Redis when another worker/pod runs it"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return dict(job)
+    if redis_state.redis_client is None:
+        return None
+    try:
+        cached = redis_state.redis_client.get(REDIS_JOB_PREFIX + job_id)
+    except Exception as e:
+        logger.warning(f"Redis lookup of admin job {job_id} failed: {e}")
+        return None
+    return json.loads(cached) if cached else None
+
+
+def _acquire(test_id: str, job_id: str) -> bool:
+    with _jobs_lock:
+        if test_id in _busy_tests:
+            return False
+        _busy_tests.add(test_id)
+    if redis_state.redis_client is None:
+        return True
+    try:
+        if redis_state.redis_client.set(REDIS_JOB_LOCK_PREFIX + test_id, job_id, nx=True, ex=ADMIN_JOB_LOCK_TTL):
+            return True
+    except Exception as e:
+        logger.warning(f"Redis lock for admin job on Test ID {test_id} failed, relying on the local lock: {e}")
+        return True
+    with _jobs_lock:
+        _busy_tests.discard(test_id)
+    return False
+
+
+def _release(test_id: str, job_id: str):
+    with _jobs_lock:
+        _busy_tests.discard(test_id)
+    if redis_state.redis_client is None:
+        return
+    try:
+        if redis_state.redis_client.get(REDIS_JOB_LOCK_PREFIX + test_id) == job_id:
+            redis_state.redis_client.delete(REDIS_JOB_LOCK_PREFIX + test_id)
+    except Exception as e:
+        logger.warning(f"Redis unlock for admin job on Test ID {test_id} failed: {e}")
+
+
+def _run(job: dict, work):
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    _save(job)
+    try:
+        job["result"] = work(job)
+        job["status"] = "succeeded"
+    except Exception as e:
+        logger.error(f"Admin job {job['job_id']} ({job['type']} Test ID {job['test_id']}) failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = time.time()
+        _save(job)
+        _release(job["test_id"], job["job_id"])
+
+
+def _submit(job_type: str, test_id: str, work, params: dict = None) -> dict:
+    job_id = str(uuid.uuid4())
+    test_id = str(test_id)
+    if not _acquire(test_id, job_id):
+        raise JobConflictError(f"A job is already running for Test ID {test_id}")
+
+    job = {
+        "job_id": job_id,
+        "type": job_type,
+        "test_id": test_id,
+        "status": "queued",
+        "params": params or {},
+        "processed_sources": 0,
+        "processed_chunks": 0,
+        "result": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+    _save(job)
+    _executor.submit(_run, job, work)
+    return dict(job)
+
+
+@instrumented("admin_delete_test")
+def _delete_work(job: dict) -> dict:
+    deleted = delete_test(job["test_id"])
+    delete_snapshot(job["test_id"])
+    return {"deleted_chunks": deleted}
+
+
+# --- Version Retirement ---
+
+def _drain_and_retire(test_id: str, name: str) -> int:
+    """
+    Copies the sources that reached `name` after the swap (workers not re-routed yet) into the
+    live version, then drops `name`. A no-op once it is retired or the test is deleted.
+    """
+    if name not in pending_retirements(test_id):
+        return 0
+
+    live = resolve_collection(test_id)[0]
+    retiree = get_collection_or_none(name)
+    drained = 0
+    if retiree is not None:
+        present = list_source_ids(live)
+        for source_id, text, metadata in iter_sources(retiree, skip=present):
+            drained += process_text_pipeline(text, metadata, collection=live, source_id=source_id)
+    if drained:
+        logger.info(f"Drained {drained} late chunks of Test ID {test_id} from {name} into {live.name}")
+        delete_snapshot(test_id)
+
+    retire_version(test_id, name)
+    return drained
+
+
+def _retire_locked(test_id: str, name: str) -> bool:
+    """Retires under the test's job lock, so it never races a delete / re-index. False if busy or failed."""
+    lock_id = f"retire-{uuid.uuid4()}"
+    if not _acquire(test_id, lock_id):
+        return False
+    try:
+        _drain_and_retire(test_id, name)
+        return True
+    except Exception as e:
+        logger.error(f"Retiring {name} of Test ID {test_id} failed, will retry: {e}")
+        return False
+    finally:
+        _release(test_id, lock_id)
+
+
+def schedule_retirement(test_id: str, name: str, delay: float = None):
+    """
+    Queues `name` for retirement once the delay has passed. With Redis any worker/pod may run it
+    (see retire_due_versions); without Redis a local timer does, and `python -m scripts.partitions retire`
+    re-drives what a restart lost.
+    """
+    delay = VERSION_RETIRE_DELAY_SECONDS if delay is None else delay
+    if redis_state.redis_client is not None:
+        try:
+            # nx: re-scheduling a version already queued never postpones it
+            redis_state.redis_client.zadd(REDIS_RETIRE_QUEUE, {f"{test_id} {name}": time.time() + delay}, nx=True)
+            return
+        except Exception as e:
+            logger.warning(f"Redis queueing of {name} failed, retiring it from this process: {e}")
+
+    timer = threading.Timer(delay, _retire_locked, args=(test_id, name))
+    timer.daemon = True
+    timer.start()
+
+
+def retire_due_versions() -> int:
+    """Retires every queued version whose delay has passed. Failed or busy ones stay queued."""
+    if redis_state.redis_client is None:
+        return 0
+    try:
+        due = redis_state.redis_client.zrangebyscore(REDIS_RETIRE_QUEUE, "-inf", time.time())
+    except Exception as e:
+        logger.warning(f"Redis lookup of retiring versions failed: {e}")
+        return 0
+
+    retired = 0
+    for member in due:
+        test_id, name = member.split(" ", 1)
+        if _retire_locked(test_id, name):
+            redis_state.redis_client.zrem(REDIS_RETIRE_QUEUE, member)
+            retired += 1
+    return retired
+
+
+def retire_pending(test_id: str) -> int:
+    """Retires every version the test's base partition still lists as retiring, right away"""
+    retired = 0
+    for name in pending_retirements(test_id):
+        if not _retire_locked(test_id, name):
+            raise RuntimeError(f"Could not retire {name} of Test ID {test_id} (a job is running or it failed)")
+        retired += 1
+    return retired
+
+
+def start_retirement_sweeper():
+    """Background thread running retire_due_versions every RETIRE_SWEEP_SECONDS (needs Redis)"""
+    global _sweeper_started
+    if redis_state.redis_client is None or _sweeper_started:
+        return
+    _sweeper_started = True
+
+    def sweep():
+        while True:
+            time.sleep(RETIRE_SWEEP_SECONDS)
+            try:
+                retire_due_versions()
+            except Exception as e:
+                logger.error(f"Retiring index versions failed: {e}")
+
+    threading.Thread(target=sweep, name="version-retirer", daemon=True).start()
+
+
+def _rebuild_pass(job: dict, live, target, done_sources: set):
+    """Re-chunks / re-embeds every source of `live` not in done_sources into `target`, rate limited"""
+    for source_id, text, metadata in iter_sources(live, skip=done_sources):
+        started = time.monotonic()
+        stored = process_text_pipeline(text, metadata, collection=target, update_snapshot=False, source_id=source_id)
+        done_sources.add(source_id)
+
+        job["processed_sources"] += 1
+        job["processed_chunks"] += stored
+        _save(job)
+
+        # Throttle: keep the rebuild from starving live ingestion of embedding / Chroma quota
+        budget = stored / REINDEX_MAX_CHUNKS_PER_SECOND if REINDEX_MAX_CHUNKS_PER_SECOND > 0 else 0
+        elapsed = time.monotonic() - started
+        if budget > elapsed:
+            time.sleep(budget - elapsed)
+
+
+@instrumented("admin_reindex_test")
+def _reindex_work(job: dict) -> dict:
+    """
+    Builds a new version of the test's index from the texts stored in the live version, then
+    swaps it in atomically. Reads keep hitting the live version until the swap.
+    """
+    test_id = job["test_id"]
+    params = job["params"]
+
+    # --- 1. Make sure the test lives in its own partition ---
+    _, where = resolve_collection(test_id)
+    if where is not None:
+        if not partitioning_enabled():
+            raise ValueError("Re-indexing needs per-test collections (VECTOR_PARTITIONING=test)")
+        if not rag_state.collection.get(where=where, include=[], limit=1).get("ids"):
+            raise ValueError(f"No content found for Test ID {test_id}")
+        migrate_test(test_id)
+    live = resolve_collection(test_id)[0]
+
+    # --- 2. Rebuild into a hidden version ---
+    target = create_version(test_id, params["chunk_size"], params["chunk_overlap"], params["embedding_model"])
+    logger.info(f"Re-indexing Test ID {test_id} from {live.name} into {target.name}")
+    # Versions a crashed build or a lost retirement left behind
+    for name in pending_retirements(test_id):
+        schedule_retirement(test_id, name)
+    done_sources = set()
+    try:
+        live_count = live.count()
+        _rebuild_pass(job, live, target, done_sources)
+
+        # --- 3. Catch up with ingestions that landed in the live version meanwhile ---
+        for _ in range(REINDEX_CATCH_UP_PASSES):
+            current_count = live.count()
+            if current_count == live_count:
+                break
+            live_count = current_count
+            _rebuild_pass(job, live, target, done_sources)
+        else:
+            logger.warning(f"Test ID {test_id} kept receiving ingestions during re-index, swapping anyway")
+    except Exception:
+        # Readers never saw the half-built version, just drop it (or leave it to the next create_version)
+        try:
+            retire_version(test_id, target.name)
+        except Exception as e:
+            logger.error(f"Dropping the unfinished build {target.name} failed: {e}")
+        raise
+
+    # --- 4. Atomic swap, stale snapshots dropped everywhere, old version drained and retired later ---
+    previous = activate_version(test_id, target)
+    delete_snapshot(test_id)
+    schedule_retirement(test_id, previous)
+
+    return {"version": target.name, "previous_version": previous, "chunks": target.count()}
+
+
+def submit_delete_job(test_id: str) -> dict:
+    """Deletes every chunk and the local snapshot of a test in the background"""
+    return _submit("delete", test_id, _delete_work)
+
+
+def submit_reindex_job(test_id: str, chunk_size: int, chunk_overlap: int, embedding_model: str = None) -> dict:
+    """Re-chunks and re-embeds a test in the background and swaps the new index in when done"""
+    params = {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": embedding_model or rag_state.DEFAULT_EMBEDDING_MODEL,
+    }
+    return _submit("reindex", test_id, _reindex_work, params)
@@ -0,0 +1,639 @@
+import os
+import re
+import json
+import hashlib
+import time
+import threading
+from typing import Iterator, Sequence
+from cachetools import TLRUCache
+from dotenv import load_dotenv
+from loguru import logger
+import utils.rag_initialization as rag_state
+import utils.redis_init as redis_state
+from utils.metrics import record_cache
+
+load_dotenv()
+
+# ChromaDB Cloud caps a single get() at 300 records, same as the add() batch limit
+CHROMA_PAGE_SIZE = int(os.getenv("CHROMA_PAGE_SIZE", "300"))
+
+# --- Partitioning ---
+# "test":   every test gets its own collection (rag_test_<test_id>), so a search only ever scans
+#           that test's vectors. Tests still in the shared collection are read from there (with the
+#           test_id filter) until they are migrated, which happens on their next ingestion or with
+#           `python -m scripts.partitions migrate`.
+# "shared": everything stays in rag_knowledge_base_v1, filtered by test_id (previous behaviour).
+VECTOR_PARTITIONING = os.getenv("VECTOR_PARTITIONING", "test").lower()
+PARTITION_PREFIX = "rag_test_"
+PARTITION_ROUTE_TTL = int(os.getenv("PARTITION_ROUTE_TTL", "600"))            # cached partition handles
+PARTITION_MISS_TTL = int(os.getenv("PARTITION_MISS_TTL", "30"))               # cached "not migrated yet" answers
+PARTITION_ROUTE_CACHE_SIZE = int(os.getenv("PARTITION_ROUTE_CACHE_SIZE", "10000"))
+# Bumped on every migration, version swap and delete of a test; a cached route from an older epoch
+# is dropped on the next lookup in every process. Without Redis, routes only expire by TTL.
+REDIS_ROUTE_EPOCH_PREFIX = "partition_epoch:"
+
+# Chunking settings of indexes built before re-indexing existed (and of the shared collection)
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+# Per-chunk metadata written by process_text_pipeline, not part of the source's own metadata
+CHUNK_METADATA_KEYS = ("chunk_index", "chunk_overlap")
+# process_text_pipeline drops trailing windows this short (they only repeat the previous chunk's tail)
+MIN_CHUNK_CHARS = 50
+
+# Chroma collection names: 3-512 chars of [a-zA-Z0-9._-], starting and ending with an alphanumeric
+_PARTITIONABLE_ID = re.compile(r"[A-Za-z0-9]([A-Za-z0-9._-]{0,200}[A-Za-z0-9])?")
+
+_SHARED = object() # route cache marker: the test still lives in the shared collection
+
+
+def _route_ttu(_key, value, now):
+    return now + (PARTITION_MISS_TTL if value[0] is _SHARED else PARTITION_ROUTE_TTL)
+
+
+_routes = TLRUCache(maxsize=PARTITION_ROUTE_CACHE_SIZE, ttu=_route_ttu, timer=time.monotonic)
+_routes_lock = threading.Lock()
+
+
+class TenantMismatchError(Exception):
+    """Raised when a request's tenant_id does not own the test it addresses"""
+
+
+def partitioning_enabled() -> bool:
+    return VECTOR_PARTITIONING == "test"
+
+
+def partition_name(test_id: str) -> str:
+    return PARTITION_PREFIX + str(test_id)
+
+
+def _can_partition(test_id: str) -> bool:
+    return partitioning_enabled() and bool(_PARTITIONABLE_ID.fullmatch(str(test_id)))
+
+
+def _shared_where(test_id: str, tenant_id: str = None) -> dict:
+    if tenant_id:
+        return {"$and": [{"test_id": str(test_id)}, {"tenant_id": str(tenant_id)}]}
+    return {"test_id": str(test_id)}
+
+
+def _not_found_errors():
+    # Imported lazily, chromadb stays out of process startup (older clients raise ValueError)
+    from chromadb.errors import NotFoundError
+    return (NotFoundError, ValueError)
+
+
+def _check_tenant(collection, test_id: str, tenant_id: str = None):
+    owner = (collection.metadata or {}).get("tenant_id")
+    if tenant_id and owner and owner != str(tenant_id):
+        raise TenantMismatchError(f"Test ID {test_id} does not belong to tenant {tenant_id}")
+
+
+def invalidate_route(test_id: str):
+    with _routes_lock:
+        _routes.pop(str(test_id), None)
+
+
+def _route_epoch(test_id: str):
+    """Routing epoch of a test shared through Redis (None without Redis: trust the cache until its TTL)"""
+    if redis_state.redis_client is None:
+        return None
+    try:
+        value = redis_state.redis_client.get(REDIS_ROUTE_EPOCH_PREFIX + str(test_id))
+    except Exception as e:
+        logger.warning(f"Redis lookup of partition epoch failed: {e}")
+        return None
+    return int(value) if value is not None else 0
+
+
+def publish_route_change(test_id: str):
+    """
+    Call after changing where a test lives (Chroma first, then this): every process drops
+    its cached route on its next lookup instead of serving the old collection until the TTL.
+    """
+    invalidate_route(test_id)
+    if redis_state.redis_client is None:
+        return
+    try:
+        redis_state.redis_client.incr(REDIS_ROUTE_EPOCH_PREFIX + str(test_id))
+    except Exception as e:
+        logger.warning(f"Redis epoch bump failed, other workers may route Test ID {test_id} to an old collection for up to {PARTITION_ROUTE_TTL}s: {e}")
+
+
+def _lookup_partition(test_id: str):
+    """Partition collection of a test, or None while the test still lives in the shared collection"""
+    test_id = str(test_id)
+    # Read before Chroma: a change published meanwhile makes the cached answer look stale, never fresh
+    epoch = _route_epoch(test_id)
+    with _routes_lock:
+        cached = _routes.get(test_id)
+    route = cached[0] if cached is not None and (epoch is None or cached[1] == epoch) else None
+    record_cache("partition_route", route is not None)
+
+    if route is None:
+        try:
+            route = rag_state.chroma_client.get_collection(name=partition_name(test_id))
+            metadata = route.metadata or {}
+            # A partition being filled by a migration is not readable yet
+            if metadata.get("state") == "migrating":
+                route = _SHARED
+            elif metadata.get("active"):
+                # The test was re-indexed: the base partition only points at the live version
+                route = rag_state.chroma_client.get_collection(name=metadata["active"])
+        except _not_found_errors():
+            route = _SHARED
+        with _routes_lock:
+            _routes[test_id] = (route, epoch)
+
+    return None if route is _SHARED else route
+
+
+def resolve_collection(test_id: str, tenant_id: str = None):
+    """
+    Routing layer for reads. Returns (collection, where): the test's partition with no filter,
+    or the shared collection with a test_id (+ tenant_id) filter.
+    Raises TenantMismatchError if tenant_id is given and the partition belongs to another tenant.
+    """
+    if _can_partition(test_id):
+        partition = _lookup_partition(test_id)
+        if partition is not None:
+            _check_tenant(partition, test_id, tenant_id)
+            return partition, None
+    return rag_state.collection, _shared_where(test_id, tenant_id)
+
+
+def get_write_collection(test_id: str, tenant_id: str = None):
+    """
+    Routing layer for writes. Creates the test's partition on first use (owned by tenant_id),
+    moving any chunks the test already has in the shared collection into it first.
+    """
+    if not _can_partition(test_id):
+        return rag_state.collection
+
+    partition = _lookup_partition(test_id)
+    if partition is None:
+        shared_rows = rag_state.collection.get(where=_shared_where(test_id), include=[], limit=1)
+        if shared_rows.get("ids"):
+            partition = migrate_test(test_id, tenant_id=tenant_id)
+        else:
+            metadata = {"test_id": str(test_id)}
+            if tenant_id:
+                metadata["tenant_id"] = str(tenant_id)
+            # get_or_create keeps the metadata of a partition another worker created concurrently
+            partition = rag_state.chroma_client.get_or_create_collection(name=partition_name(test_id), metadata=metadata)
+            publish_route_change(test_id)
+
+    _check_tenant(partition, test_id, tenant_id)
+    return partition
+
+
+def index_settings(collection) -> dict:
+    """Chunking / embedding settings a collection was built with"""
+    metadata = collection.metadata or {}
+    return {
+        "chunk_size": int(metadata.get("chunk_size", DEFAULT_CHUNK_SIZE)),
+        "chunk_overlap": int(metadata.get("chunk_overlap", DEFAULT_CHUNK_OVERLAP)),
+        "embedding_model": metadata.get("embedding_model") or rag_state.DEFAULT_EMBEDDING_MODEL,
+    }
+
+
+def iter_test_pages(test_id: str, include: Sequence[str] = ("documents",), page_size: int = CHROMA_PAGE_SIZE,
+                    collection=None, where=None) -> Iterator[dict]:
+    """
+    Streams a test's chunks from the vector store, one collection.get page at a time.
+    Only the fields in `include` are fetched (ids are always returned), so callers that
+    need text never pull embeddings. Stops fetching as soon as the consumer stops iterating.
+    """
+    if collection is None:
+        collection, where = resolve_collection(test_id)
+
+    offset = 0
+    while True:
+        page = collection.get(
+            where=where,
+            include=list(include),
+            limit=page_size,
+            offset=offset,
+        )
+        page_ids = page.get("ids") or []
+        if not page_ids:
+            return
+
+        yield page
+        offset += len(page_ids)
+        if len(page_ids) < page_size:
+            return
+
+
+def iter_test_documents(test_id: str, page_size: int = CHROMA_PAGE_SIZE) -> Iterator[str]:
+    """Yields a test's chunk texts one by one (documents only, paged)"""
+    for page in iter_test_pages(test_id, include=("documents",), page_size=page_size):
+        for document in page.get("documents") or []:
+            if document:
+                yield document
+
+
+def delete_in_batches(collection, where=None, ids=None, page_size: int = CHROMA_PAGE_SIZE) -> int:
+    """Deletes the given ids, or every row matching `where`, one page at a time. Returns the count."""
+    if ids is not None:
+        for i in range(0, len(ids), page_size):
+            collection.delete(ids=ids[i:i + page_size])
+        return len(ids)
+
+    deleted = 0
+    while True:
+        # Always read from offset 0: every pass removes the rows it just read
+        batch_ids = collection.get(where=where, include=[], limit=page_size).get("ids") or []
+        if not batch_ids:
+            return deleted
+        collection.delete(ids=batch_ids)
+        deleted += len(batch_ids)
+
+
+def migrate_test(test_id: str, tenant_id: str = None, delete_shared: bool = True, page_size: int = CHROMA_PAGE_SIZE):
+    """
+    Copies a test's chunks from the shared collection into its partition (upserts, so a rerun
+    after a crash is safe), marks the partition readable and removes the shared copies.
+    tenant_id defaults to the one stored in the chunks' metadata.
+    """
+    test_id = str(test_id)
+    metadata = {"test_id": test_id, "state": "migrating"}
+    if tenant_id:
+        metadata["tenant_id"] = str(tenant_id)
+    partition = rag_state.chroma_client.get_or_create_collection(name=partition_name(test_id), metadata=metadata)
+
+    copied_ids = []
+    owner = (partition.metadata or {}).get("tenant_id") or (str(tenant_id) if tenant_id else None)
+    try:
+        for page in iter_test_pages(test_id, include=("embeddings", "documents", "metadatas"), page_size=page_size,
+                                    collection=rag_state.collection, where=_shared_where(test_id)):
+            if owner is None and page["metadatas"]:
+                owner = page["metadatas"][0].get("tenant_id")
+            partition.upsert(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+            )
+            copied_ids.extend(page["ids"])
+    except Exception:
+        # The shared copies are untouched until the flip below: drop the half-filled partition
+        abandon_migration(test_id)
+        raise
+
+    # Flip the partition to readable only once it holds every chunk
+    ready_metadata = {"test_id": test_id}
+    if owner:
+        ready_metadata["tenant_id"] = str(owner)
+    partition.modify(metadata=ready_metadata)
+    partition = rag_state.chroma_client.get_collection(name=partition_name(test_id))
+    # Other workers cached "still in the shared collection", whose rows are about to go
+    publish_route_change(test_id)
+
+    if delete_shared and copied_ids:
+        delete_in_batches(rag_state.collection, ids=copied_ids, page_size=page_size)
+    logger.info(f"-> Migrated {len(copied_ids)} chunks of Test ID {test_id} into {partition_name(test_id)}")
+    return partition
+
+
+def abandon_migration(test_id: str):
+    """Drops a test's partition if it is still being filled by a migration (its chunks remain in the shared collection)"""
+    partition = get_collection_or_none(partition_name(test_id))
+    if partition is None or (partition.metadata or {}).get("state") != "migrating":
+        return
+    try:
+        rag_state.chroma_client.delete_collection(name=partition.name)
+    except _not_found_errors():
+        pass
+    publish_route_change(test_id)
+    logger.warning(f"Abandoned the unfinished migration of Test ID {test_id}")
+
+
+def _version_names(base) -> list:
+    """Every collection a test's base partition knows about: itself, the live version, builds and retirees"""
+    metadata = base.metadata or {}
+    names = [base.name, metadata.get("active"), metadata.get("building")]
+    names += (metadata.get("retiring") or "").split(",")
+    return [name for name in dict.fromkeys(names) if name]
+
+
+def get_collection_or_none(name: str):
+    try:
+        return rag_state.chroma_client.get_collection(name=name)
+    except _not_found_errors():
+        return None
+
+
+def pending_retirements(test_id: str) -> list:
+    """Versions of a test waiting to be dropped (recorded on the base partition, so they survive restarts)"""
+    base = get_collection_or_none(partition_name(test_id))
+    if base is None:
+        return []
+    return [name for name in ((base.metadata or {}).get("retiring") or "").split(",") if name]
+
+
+def list_partitioned_test_ids(page_size: int = CHROMA_PAGE_SIZE):
+    """test_ids that have a base partition (one list_collections page at a time)"""
+    test_ids = []
+    offset = 0
+    while True:
+        page = rag_state.chroma_client.list_collections(limit=page_size, offset=offset)
+        if not page:
+            return test_ids
+        for collection in page:
+            name = getattr(collection, "name", collection)
+            # Index versions are rag_test_<test_id>.v<N>
+            if name.startswith(PARTITION_PREFIX) and ".v" not in name:
+                test_ids.append(name[len(PARTITION_PREFIX):])
+        offset += len(page)
+        if len(page) < page_size:
+            return test_ids
+
+
+def create_version(test_id: str, chunk_size: int, chunk_overlap: int, embedding_model: str):
+    """
+    Creates an empty collection for a rebuild of the test's index (rag_test_<test_id>.v<N>).
+    It is invisible to readers until activate_version() points the base partition at it.
+    A build left behind by a crashed job is moved to the retiring list (see pending_retirements).
+    """
+    base = rag_state.chroma_client.get_collection(name=partition_name(test_id))
+    base_metadata = dict(base.metadata or {})
+    version = int(base_metadata.get("version", 1)) + 1
+    name = f"{partition_name(test_id)}.v{version}"
+
+    # Record the build first, so a crashed job never reuses (or leaks) a half-filled collection
+    retiring = [n for n in (base_metadata.get("retiring") or "").split(",") if n]
+    if base_metadata.get("building"):
+        retiring.append(base_metadata["building"])
+    base.modify(metadata=dict(base_metadata, version=version, building=name, retiring=",".join(dict.fromkeys(retiring))))
+
+    live = resolve_collection(test_id)[0]
+    metadata = {
+        "test_id": str(test_id),
+        "version": version,
+        "state": "building",
+        "chunk_size": int(chunk_size),
+        "chunk_overlap": int(chunk_overlap),
+        "embedding_model": embedding_model or rag_state.DEFAULT_EMBEDDING_MODEL,
+    }
+    tenant_id = (live.metadata or {}).get("tenant_id")
+    if tenant_id:
+        metadata["tenant_id"] = tenant_id
+    return rag_state.chroma_client.get_or_create_collection(name=name, metadata=metadata)
+
+
+def activate_version(test_id: str, version) -> str:
+    """
+    Atomically makes `version` the live index of the test (a single metadata update on the
+    base partition). Returns the name of the previous version, which is now retiring.
+    """
+    ready_metadata = {k: v for k, v in (version.metadata or {}).items() if k != "state"}
+    version.modify(metadata=ready_metadata)
+
+    base = rag_state.chroma_client.get_collection(name=partition_name(test_id))
+    metadata = dict(base.metadata or {})
+    previous = metadata.get("active") or base.name
+    retiring = [name for name in (metadata.get("retiring") or "").split(",") if name]
+    metadata.update(active=version.name, retiring=",".join(dict.fromkeys(retiring + [previous])))
+    metadata.pop("building", None)
+    base.modify(metadata=metadata)
+
+    publish_route_change(test_id)
+    logger.info(f"-> Test ID {test_id} now served from {version.name} (was {previous})")
+    return previous
+
+
+def retire_version(test_id: str, name: str, page_size: int = CHROMA_PAGE_SIZE) -> int:
+    """
+    Drops a version that no longer serves reads (a retired live version, or an abandoned build).
+    The base partition carries the version pointer, so its rows are deleted in batches instead
+    of dropping the collection.
+    """
+    try:
+        base = rag_state.chroma_client.get_collection(name=partition_name(test_id))
+    except _not_found_errors():
+        return 0 # the whole test was deleted meanwhile
+    if name == ((base.metadata or {}).get("active") or base.name):
+        raise ValueError(f"{name} is the live version of Test ID {test_id}")
+
+    deleted = 0
+    try:
+        if name == base.name:
+            deleted = delete_in_batches(base, page_size=page_size)
+        else:
+            deleted = rag_state.chroma_client.get_collection(name=name).count()
+            rag_state.chroma_client.delete_collection(name=name)
+    except _not_found_errors():
+        pass
+
+    metadata = dict(base.metadata or {})
+    metadata["retiring"] = ",".join(n for n in (metadata.get("retiring") or "").split(",") if n and n != name)
+    if metadata.get("building") == name:
+        metadata.pop("building")
+    base.modify(metadata=metadata)
+    logger.info(f"-> Retired {name} ({deleted} chunks)")
+    return deleted
+
+
+def _is_tracked(metadata: dict) -> bool:
+    return metadata.get("source_id") is not None and metadata.get("chunk_index") is not None
+
+
+def _boundary_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _chain_legacy_chunks(legacy: list) -> list:
+    """
+    Orders untracked chunks into the documents they were cut from. Such chunks come from the
+    fixed sliding window, so a chunk reaching past the next window start is followed by the
+    chunk whose head repeats that part (same metadata). Scan order breaks ties: a document's
+    chunks were added in one batch.
+    `legacy` holds (chunk_id, group, head, tail) tuples, tail None for a document's last chunk.
+    Returns lists of chunk ids.
+    """
+    by_head = {}
+    for position, (_, group, head, _) in enumerate(legacy):
+        by_head.setdefault((group, head), []).append(position)
+
+    successor = [None] * len(legacy)
+    claimed = set()
+    for position, (_, group, _, tail) in enumerate(legacy):
+        if tail is None:
+            continue
+        candidates = [c for c in by_head.get((group, tail), ()) if c != position and c not in claimed]
+        if candidates:
+            later = [c for c in candidates if c > position]
+            successor[position] = later[0] if later else candidates[0]
+            claimed.add(successor[position])
+
+    chains = []
+    visited = set()
+    # Chain starts first, then whatever is left (only repeated text can form a cycle)
+    for start in [p for p in range(len(legacy)) if p not in claimed] + list(range(len(legacy))):
+        if start in visited:
+            continue
+        chain = []
+        position = start
+        while position is not None and position not in visited:
+            visited.add(position)
+            chain.append(legacy[position][0])
+            position = successor[position]
+        chains.append(chain)
+    return chains
+
+
+def _fetch_chunks(collection, ids, page_size: int = CHROMA_PAGE_SIZE) -> dict:
+    chunks = {}
+    for i in range(0, len(ids), page_size):
+        page = collection.get(ids=ids[i:i + page_size], include=["documents", "metadatas"])
+        for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            chunks[chunk_id] = (document or "", metadata or {})
+    return chunks
+
+
+def list_source_ids(collection, page_size: int = CHROMA_PAGE_SIZE) -> set:
+    """source_ids present in a collection (metadata-only scan; untracked chunks count under their own id)"""
+    source_ids = set()
+    for page in iter_test_pages(None, include=("metadatas",), page_size=page_size, collection=collection):
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            metadata = metadata or {}
+            source_ids.add(str(metadata["source_id"]) if _is_tracked(metadata) else chunk_id)
+    return source_ids
+
+
+def iter_sources(collection, skip=(), page_size: int = CHROMA_PAGE_SIZE):
+    """
+    Reassembles the original texts from a collection's chunks, one source at a time: chunks
+    grouped by source_id and ordered by chunk_index, each minus the overlap it shares with the
+    previous one. Chunks ingested before sources were tracked are stitched back together from
+    their overlaps (source_id: the id of the document's first chunk).
+    Memory follows the largest source, plus a few hashes per untracked chunk.
+    Yields (source_id, text, metadata).
+    """
+    settings = index_settings(collection)
+    overlap = settings["chunk_overlap"]
+    step = settings["chunk_size"] - overlap
+
+    # --- 1. One pass: distinct sources, and only the boundaries of untracked chunks ---
+    source_ids = {}
+    legacy = []
+    for page in iter_test_pages(None, include=("documents", "metadatas"), page_size=page_size, collection=collection):
+        for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            metadata = metadata or {}
+            if _is_tracked(metadata):
+                source_ids.setdefault(str(metadata["source_id"]))
+                continue
+            document = document or ""
+            group = _boundary_hash(json.dumps(metadata, sort_keys=True))
+            # The next window starts at `step`; the pipeline kept it if it was long enough
+            tail = _boundary_hash(document[step:step + overlap]) if overlap and len(document) - step > MIN_CHUNK_CHARS else None
+            legacy.append((chunk_id, group, _boundary_hash(document[:overlap]), tail))
+
+    # --- 2. Tracked sources, fetched one by one ---
+    for source_id in source_ids:
+        if source_id in skip:
+            continue
+        chunks = []
+        for page in iter_test_pages(None, include=("documents", "metadatas"), page_size=page_size,
+                                    collection=collection, where={"source_id": source_id}):
+            chunks.extend((int(m["chunk_index"]), d or "", m) for d, m in zip(page["documents"], page["metadatas"]))
+        if not chunks:
+            continue # deleted meanwhile
+        chunks.sort(key=lambda chunk: chunk[0])
+        text = chunks[0][1] + "".join(document[int(metadata.get("chunk_overlap", 0)):] for _, document, metadata in chunks[1:])
+        metadata = {k: v for k, v in chunks[0][2].items() if k not in CHUNK_METADATA_KEYS}
+        yield source_id, text, metadata
+
+    # --- 3. Untracked chunks, stitched per document ---
+    for chain in _chain_legacy_chunks(legacy):
+        if chain[0] in skip:
+            continue
+        chunks = _fetch_chunks(collection, chain, page_size)
+        parts = []
+        previous = None
+        for chunk_id in chain:
+            if chunk_id not in chunks:
+                continue
+            document = chunks[chunk_id][0]
+            # A hash collision would show as a head that doesn't repeat the previous tail
+            joined = previous is not None and overlap and previous[step:step + overlap] == document[:overlap]
+            parts.append(document[overlap:] if joined else ("" if previous is None else "\n\n") + document)
+            previous = document
+        if not parts:
+            continue
+        metadata = {k: v for k, v in chunks[chain[0]][1].items() if k not in CHUNK_METADATA_KEYS} if chain[0] in chunks else {}
+        metadata["source_id"] = chain[0]
+        yield chain[0], "".join(parts), metadata
+
+
+def delete_test(test_id: str, page_size: int = CHROMA_PAGE_SIZE) -> int:
+    """
+    Removes every chunk of a test: its partitions (all index versions) are dropped in one call
+    each, leftovers in the shared collection are deleted in batches. Returns the number of chunks removed.
+    """
+    test_id = str(test_id)
+    deleted = 0
+    if _can_partition(test_id):
+        try:
+            base = rag_state.chroma_client.get_collection(name=partition_name(test_id))
+            names = _version_names(base)
+        except _not_found_errors():
+            names = []
+        for name in names:
+            try:
+                deleted += rag_state.chroma_client.get_collection(name=name).count()
+                rag_state.chroma_client.delete_collection(name=name)
+            except _not_found_errors():
+                pass
+        # Workers holding the dropped handles would fail every query and ingestion until the TTL
+        publish_route_change(test_id)
+
+    deleted += delete_in_batches(rag_state.collection, where=_shared_where(test_id), page_size=page_size)
+    logger.info(f"-> Deleted {deleted} chunks of Test ID {test_id}")
+    return deleted
+
+
+def list_shared_test_ids(page_size: int = CHROMA_PAGE_SIZE):
+    """Distinct test_ids still stored in the shared collection (metadata-only scan, for migrations)"""
+    test_ids = set()
+    offset = 0
+    while True:
+        page = rag_state.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        metadatas = page.get("metadatas") or []
+        if not metadatas:
+            return sorted(test_ids)
+        test_ids.update(str(m["test_id"]) for m in metadatas if m and m.get("test_id"))
+        offset += len(metadatas)
+        if len(metadatas) < page_size:
+            return sorted(test_ids)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; good enough for budgeting prompts
+    return (len(text) + 3) // 4
+
+
+def build_bounded_context(documents: Iterator[str], max_bytes: int, max_tokens: int, separator: str = "\n\n") -> str:
+    """
+    Concatenates documents until the next one would exceed the byte or token budget.
+    Consumes the iterator lazily, so unread pages are never fetched.
+    """
+    parts = []
+    used_bytes = 0
+    used_tokens = 0
+    separator_bytes = len(separator.encode("utf-8"))
+
+    for document in documents:
+        doc_bytes = len(document.encode("utf-8")) + (separator_bytes if parts else 0)
+        doc_tokens = estimate_tokens(document)
+        if used_bytes + doc_bytes > max_bytes or used_tokens + doc_tokens > max_tokens:
+            if not parts:
+                # A single oversized chunk: keep what fits rather than returning nothing
+                parts.append(document.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")[:max_tokens * 4])
+            logger.info(f"Context budget reached after {len(parts)} chunks ({used_bytes} bytes, ~{used_tokens} tokens)")
+            break
+        parts.append(document)
+        used_bytes += doc_bytes
+        used_tokens += doc_tokens
+
+    return separator.join(parts)